@@ -1,3 +1,4 @@
+import logging
 import numpy as np
 import os
 
@@ -106,7 +107,12 @@ def main():
     param_df.drop(columns=["gen_fun", "fit_fun"], inplace=True)
 
     results_ds = run_experiment(
-        param_df=param_df, n_seq=n_seq, n_mcsim=n_mcsim, threshold=threshold
+        param_df=param_df,
+        n_seq=n_seq,
+        n_mcsim=n_mcsim,
+        threshold=threshold,
+        timing_file=os.path.join(cache_path, "lfv-secular-timing.csv"),
+        status_file=os.path.join(cache_path, "lfv-secular-status.log"),
     )
 
     fn = os.path.join(cache_path, "lfv-secular-bias-variance.nc")
@@ -116,4 +122,5 @@ def main():
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     main()
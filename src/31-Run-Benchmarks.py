@@ -0,0 +1,35 @@
+import argparse
+
+from codebase.benchmark import (
+    PROFILES,
+    BENCHMARKS,
+    run_benchmarks,
+    save_benchmarks,
+    compare_benchmarks,
+)
+
+
+def main():
+    """Run the benchmark suite and (optionally) compare with an earlier run
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--profile", default="small", choices=list(PROFILES.keys()))
+    parser.add_argument(
+        "--groups", nargs="+", default=None, choices=list(BENCHMARKS.keys())
+    )
+    parser.add_argument(
+        "--compare", default=None, help="JSON file of an earlier run to compare with"
+    )
+    args = parser.parse_args()
+
+    results = run_benchmarks(profile=args.profile, groups=args.groups)
+    fn = save_benchmarks(results)
+    print(results.to_string())
+    print("Saved to {}".format(fn))
+
+    if args.compare is not None:
+        print(compare_benchmarks(baseline=args.compare, candidate=fn).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Read and write the cache on a background thread
+
+`run_experiment` can hand a `BackgroundIO` to `get_data`, so that cache
+writes of finished cells don't hold up the next one and the inputs of
+upcoming cells are read while the current one computes. Every read and write
+goes through a single I/O thread, in the order it was requested, so a read
+never sees a file which an earlier request is still writing.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple
+import threading
+import xarray as xr
+
+
+class BackgroundIO:
+    """A single background thread for cache reads and writes
+    """
+
+    def __init__(self, max_pending: int = 2) -> None:
+        """Start the I/O thread
+
+        Parameters
+        ----------
+        max_pending : how many writes may be queued before `write` blocks,
+            which bounds the memory held by data waiting to be written
+        """
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._writes: list = []
+        # (file name, future) of each prefetched sequence, by id: sequences
+        # which differ only in M or N share a file but not their data
+        self._prefetched: dict = {}
+
+    def _read(self, sequence) -> Tuple[xr.DataArray, bool]:
+        data, success = sequence._from_file()
+        if success and data.chunks is None:
+            data.load()
+        return data, success
+
+    def _write(self, sequence, data: xr.DataArray) -> None:
+        try:
+            sequence._write_cache(data=data)
+        finally:
+            self._slots.release()
+
+    def raise_errors(self) -> None:
+        """Re-raise the error of any write which has failed
+        """
+        for future in self._writes:
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+        self._writes = [future for future in self._writes if not future.done()]
+
+    def prefetch(self, sequence) -> None:
+        """Start reading the cache of a sequence which will be needed soon
+
+        Parameters
+        ----------
+        sequence : the generator or fitter
+        """
+        if id(sequence) not in self._prefetched:
+            self._prefetched[id(sequence)] = (
+                sequence._get_filename(),
+                self._executor.submit(self._read, sequence),
+            )
+
+    def read(self, sequence) -> Tuple[xr.DataArray, bool]:
+        """Read the cache of a sequence, using the prefetched data if any
+
+        Parameters
+        ----------
+        sequence : the generator or fitter
+        """
+        self.raise_errors()
+        _, future = self._prefetched.pop(id(sequence), (None, None))
+        if future is None:
+            future = self._executor.submit(self._read, sequence)
+        return future.result()
+
+    def write(self, sequence, data: xr.DataArray) -> None:
+        """Queue the data of a sequence to be written to its cache
+
+        Blocks if `max_pending` writes are already queued.
+
+        Parameters
+        ----------
+        sequence : the generator or fitter
+        data : the data to write
+        """
+        self.raise_errors()
+        # anything prefetched from this file is now out of date
+        filename = sequence._get_filename()
+        self._prefetched = {
+            key: (prefetched_file, future)
+            for key, (prefetched_file, future) in self._prefetched.items()
+            if prefetched_file != filename
+        }
+        self._slots.acquire()
+        self._writes.append(self._executor.submit(self._write, sequence, data))
+
+    def close(self) -> None:
+        """Wait for the queued writes to finish, then re-raise any error
+        """
+        self._executor.shutdown(wait=True)
+        self._prefetched = {}
+        self.raise_errors()
+
+    def __enter__(self) -> "BackgroundIO":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
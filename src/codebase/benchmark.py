@@ -0,0 +1,402 @@
+"""Benchmarks for the generators, fitters, evaluation and cache I/O
+
+Timings are saved as JSON (one file per commit and profile) in the cache
+folder so that runs on different commits can be compared locally. Fitters
+are timed through `_calculate_batch`, as experiments run them, once for
+each of their engines (see `FITTER_VARIANTS`).
+"""
+
+from datetime import datetime
+from typing import Callable, Dict, List
+import json
+import os
+import platform
+import subprocess
+import time
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from .path import cache_path
+from .synthetic import NINO3Linear, MarkovTwoStateChain
+from .statfit import LN2Stationary, LN2LinearTrend, TwoStateHMM
+
+# The "small" profile is quick enough to run before every commit; the "large"
+# profile matches the biggest cells of the grid in the run scripts
+PROFILES: Dict[str, dict] = {
+    "small": {
+        "M": 10,
+        "N": 30,
+        "n_seq": 20,
+        "n_mcsim": 100,
+        "n_fit": 2,
+        "n_jobs": 1,
+        "repeat": 3,
+        "eval_sizes": [(20, 100, 10), (100, 100, 50)],
+    },
+    "large": {
+        "M": 100,
+        "N": 250,
+        "n_seq": 200,
+        "n_mcsim": 1000,
+        "n_fit": 5,
+        "n_jobs": 4,
+        "repeat": 3,
+        "eval_sizes": [(100, 1000, 10), (1000, 1000, 30)],
+    },
+}
+
+THRESHOLD = 3000
+
+# the fitter and the options of each variant in the "fitter" benchmarks
+FITTER_VARIANTS = [
+    ("LN2Stationary", {}),
+    ("LN2Stationary", {"crn_seed": 1}),
+    ("LN2LinearTrend", {"engine": "nuts"}),
+    ("LN2LinearTrend", {"engine": "laplace"}),
+    ("TwoStateHMM", {"engine": "pomegranate"}),
+    ("TwoStateHMM", {"engine": "numpy"}),
+]
+
+
+def get_generators(M: int, N: int, n_seq: int) -> Dict[str, object]:
+    """The generators of the LFV-only experiment
+
+    Parameters
+    ----------
+    M : the project planning period, in years
+    N : the length of the historical record, in years
+    n_seq : how many sequences to generate
+    """
+    return {
+        "MarkovTwoStateChain": MarkovTwoStateChain(
+            M=M,
+            N=N,
+            n_seq=n_seq,
+            pi_1=0.9,
+            pi_2=0.9,
+            mu_1=6.75,
+            mu_2=6,
+            gamma_1=0,
+            gamma_2=0,
+            coeff_var=0.1,
+            sigma_min=0.01,
+        ),
+        "NINO3Linear": NINO3Linear(
+            M=M,
+            N=N,
+            n_seq=n_seq,
+            gamma=0,
+            beta=0.5,
+            coeff_var=0.1,
+            sigma_min=0.01,
+            mu0=6,
+        ),
+    }
+
+
+# the class and priors of each fitter of the run scripts
+FITTERS: Dict[str, tuple] = {
+    "LN2Stationary": (
+        LN2Stationary,
+        {"mu_sd": 1.5, "mu_mean": 7, "sigma_mean": 1, "sigma_sd": 1},
+    ),
+    "LN2LinearTrend": (
+        LN2LinearTrend,
+        {
+            "mu0_mean": 7,
+            "mu0_sd": 1.5,
+            "beta_mu_mean": 0,
+            "beta_mu_sd": 0.1,
+            "cv_logmean": np.log(0.1),
+            "cv_logsd": 0.1,
+            "n_warmup": 1500,
+        },
+    ),
+    "TwoStateHMM": (TwoStateHMM, {"n_init": 50}),
+}
+
+
+def get_fitter(name: str, generator, n_mcsim: int, **kwargs):
+    """One of the fitters of the run scripts, with the same priors
+
+    Parameters
+    ----------
+    name : the name of the fitter, see `FITTERS`
+    generator : the synthetic sequence to fit
+    n_mcsim : how many Monte Carlo draws per sequence
+    kwargs : other options, e.g. `engine` or `n_jobs`
+    """
+    fitter_class, priors = FITTERS[name]
+    return fitter_class(synthetic=generator, n_mcsim=n_mcsim, **priors, **kwargs)
+
+
+def get_fitters(generator, n_mcsim: int) -> Dict[str, object]:
+    """The fitters of the run scripts, with the same priors
+
+    Parameters
+    ----------
+    generator : the synthetic sequence to fit
+    n_mcsim : how many Monte Carlo draws per sequence
+    """
+    return {name: get_fitter(name, generator, n_mcsim=n_mcsim) for name in FITTERS}
+
+
+def _timeit(func: Callable, repeat: int) -> Dict[str, float]:
+    """Call a function `repeat` times and summarize the walltime in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        tic = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - tic)
+    return {
+        "min": np.min(times),
+        "median": np.median(times),
+        "mean": np.mean(times),
+        "repeat": repeat,
+    }
+
+
+def _random_projection(n_seq: int, n_mcsim: int, M: int, N: int) -> xr.DataArray:
+    """Lognormal flows shaped like the output of `StatisticalModel._calculate_all`
+    """
+    return xr.DataArray(
+        data=np.exp(np.random.normal(loc=7, scale=0.7, size=(n_seq, n_mcsim, M))),
+        coords={
+            "sequence": 1 + np.arange(n_seq),
+            "simulation": 1 + np.arange(n_mcsim),
+            "year": 1 + np.arange(M),
+        },
+        dims=["sequence", "simulation", "year"],
+        name="Statistical Monte Carlo Projection",
+    )
+
+
+def time_generators(profile: dict) -> List[dict]:
+    """Time the generation of synthetic sequences, per 1000 sequences
+    """
+    records = []
+    generators = get_generators(M=profile["M"], N=profile["N"], n_seq=profile["n_seq"])
+    for name, generator in generators.items():
+        timing = _timeit(generator._calculate_all, repeat=profile["repeat"])
+        scale = 1000 / profile["n_seq"]
+        records.append(
+            {
+                "group": "generator",
+                "name": name,
+                "unit": "s per 1000 sequences",
+                **{key: val * scale for key, val in timing.items() if key != "repeat"},
+                "repeat": timing["repeat"],
+            }
+        )
+    return records
+
+
+def time_fitters(profile: dict) -> List[dict]:
+    """Time each variant of each fitter on a handful of sequences, per sequence
+
+    The sequences are fit by `_calculate_batch` with the profile's `n_jobs`,
+    so the worker pool, the vectorized engines and common random numbers
+    are all part of the timings.
+    """
+    records = []
+    generator = get_generators(M=profile["M"], N=profile["N"], n_seq=profile["n_fit"])[
+        "NINO3Linear"
+    ]
+    generator.data = generator._calculate_all()
+    sequences = generator.data["sequence"].values
+    for name, options in FITTER_VARIANTS:
+        fitter = get_fitter(
+            name,
+            generator,
+            n_mcsim=profile["n_mcsim"],
+            n_jobs=profile["n_jobs"],
+            **options
+        )
+        fitter._calculate_batch(sequences[:1])  # compile
+        timing = _timeit(lambda: fitter._calculate_batch(sequences), repeat=1)
+        scale = 1 / profile["n_fit"]
+        label = " ".join("{}={}".format(key, val) for key, val in options.items())
+        records.append(
+            {
+                "group": "fitter",
+                "name": "{} {}".format(name, label).strip(),
+                "unit": "s per sequence",
+                **{key: val * scale for key, val in timing.items() if key != "repeat"},
+                "repeat": profile["n_fit"],
+            }
+        )
+    return records
+
+
+def time_evaluate(profile: dict) -> List[dict]:
+    """Time `StatisticalModel.evaluate` across array sizes
+    """
+    records = []
+    for n_seq, n_mcsim, M in profile["eval_sizes"]:
+        generator = get_generators(M=M, N=profile["N"], n_seq=n_seq)["NINO3Linear"]
+        generator.data = generator._calculate_all()
+        fitter = get_fitter("LN2Stationary", generator, n_mcsim=n_mcsim)
+        fitter.data = _random_projection(
+            n_seq=n_seq, n_mcsim=n_mcsim, M=M, N=profile["N"]
+        )
+        timing = _timeit(
+            lambda: fitter.evaluate(threshold=THRESHOLD), repeat=profile["repeat"]
+        )
+        records.append(
+            {
+                "group": "evaluate",
+                "name": "n_seq={} n_mcsim={} M={}".format(n_seq, n_mcsim, M),
+                "unit": "s per call",
+                **timing,
+            }
+        )
+    return records
+
+
+def time_cache_io(profile: dict) -> List[dict]:
+    """Time writing and reading back a cached projection to netCDF
+    """
+    records = []
+    for n_seq, n_mcsim, M in profile["eval_sizes"]:
+        generator = get_generators(M=M, N=profile["N"], n_seq=n_seq)["NINO3Linear"]
+        fitter = get_fitter("LN2Stationary", generator, n_mcsim=n_mcsim)
+        fitter.cache_dir = get_benchmark_dir()  # don't clobber real cache files
+        data = _random_projection(n_seq=n_seq, n_mcsim=n_mcsim, M=M, N=profile["N"])
+        name = "n_seq={} n_mcsim={} M={}".format(n_seq, n_mcsim, M)
+
+        def _read():
+            fits, success = fitter._from_file()
+            if not success:
+                raise RuntimeError("Can't read back {}".format(fitter._get_filename()))
+            fits.load()
+            fits.close()
+
+        write = _timeit(lambda: fitter._to_file(data=data), repeat=profile["repeat"])
+        read = _timeit(_read, repeat=profile["repeat"])
+        nbytes = os.path.getsize(fitter._get_filename())
+        os.remove(fitter._get_filename())
+        for stage, timing in [("write", write), ("read", read)]:
+            records.append(
+                {
+                    "group": "cache_io",
+                    "name": "{} {}".format(stage, name),
+                    "unit": "s per file",
+                    "bytes": nbytes,
+                    **timing,
+                }
+            )
+    return records
+
+
+BENCHMARKS: Dict[str, Callable] = {
+    "generator": time_generators,
+    "fitter": time_fitters,
+    "evaluate": time_evaluate,
+    "cache_io": time_cache_io,
+}
+
+
+def run_benchmarks(profile: str = "small", groups: List[str] = None) -> pd.DataFrame:
+    """Run the benchmark suite
+
+    Parameters
+    ----------
+    profile : either 'small' or 'large', see `PROFILES`
+    groups : which benchmarks to run (default all), see `BENCHMARKS`
+    """
+    if profile not in PROFILES:
+        raise ValueError("Invalid profile: {} not recognized".format(profile))
+    groups = list(BENCHMARKS.keys()) if groups is None else groups
+    records: List[dict] = []
+    for group in groups:
+        records += BENCHMARKS[group](PROFILES[profile])
+    results = pd.DataFrame.from_records(records)
+    results["profile"] = profile
+    return results
+
+
+def _get_commit() -> str:
+    """The current git commit, or 'unknown' outside of a repository
+    """
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+        )
+        return commit.decode("ascii").strip()
+    except BaseException:
+        return "unknown"
+
+
+def get_benchmark_dir() -> str:
+    """The folder of the benchmark results, and of the files they write
+    """
+    file_dir = os.path.join(cache_path, "benchmarks")
+    if not os.path.isdir(file_dir):
+        os.makedirs(file_dir)
+    return file_dir
+
+
+def get_benchmark_filename(profile: str, commit: str = None) -> str:
+    """Where the results for a given commit and profile are saved
+    """
+    commit = _get_commit() if commit is None else commit
+    return os.path.join(get_benchmark_dir(), "{}-{}.json".format(commit, profile))
+
+
+def save_benchmarks(results: pd.DataFrame, filename: str = None) -> str:
+    """Save benchmark results as JSON, along with the commit and platform
+
+    Parameters
+    ----------
+    results : the output of `run_benchmarks`
+    filename : where to save, defaults to `get_benchmark_filename`
+    """
+    profile = results["profile"].iloc[0]
+    commit = _get_commit()
+    if filename is None:
+        filename = get_benchmark_filename(profile=profile, commit=commit)
+    output = {
+        "commit": commit,
+        "profile": profile,
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.node(),
+        "numpy": np.__version__,
+        "xarray": xr.__version__,
+        "results": results.to_dict(orient="records"),
+    }
+    with open(filename, "w") as file:
+        json.dump(output, file, indent=2, default=float)
+    return filename
+
+
+def load_benchmarks(filename: str) -> pd.DataFrame:
+    """Read benchmark results saved by `save_benchmarks`
+    """
+    with open(filename) as file:
+        output = json.load(file)
+    results = pd.DataFrame.from_records(output["results"])
+    results["commit"] = output["commit"]
+    return results
+
+
+def compare_benchmarks(baseline: str, candidate: str) -> pd.DataFrame:
+    """Compare two saved benchmark runs
+
+    A `ratio` above 1 means the candidate is slower than the baseline.
+
+    Parameters
+    ----------
+    baseline : filename of the reference results
+    candidate : filename of the results to compare against the baseline
+    """
+    index = ["group", "name"]
+    base = load_benchmarks(baseline).set_index(index)["median"]
+    cand = load_benchmarks(candidate).set_index(index)["median"]
+    comparison = pd.DataFrame({"baseline": base, "candidate": cand})
+    comparison["ratio"] = comparison["candidate"] / comparison["baseline"]
+    return comparison
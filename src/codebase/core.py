@@ -4,10 +4,14 @@
 from collections import OrderedDict
 from typing import Tuple
 import os
+import uuid
 import numpy as np
 import xarray as xr
 import pandas as pd
 
+from .instrument import recorder
+from .path import cache_path
+
 
 class BaseSequence:
     def __init__(self, M: int, N: int, category: str, **kwargs) -> None:
@@ -20,11 +24,20 @@ class BaseSequence:
         category : what kind of sequence is this?
         """
         self.param: dict = {}  # initialize
+        self.options: dict = {}
         self.M = np.int(M)
         self.N = np.int(N)
         self.category = category
+        self.cache_dir = cache_path  # the folder of the cache files
         self.data = None
 
+    def __getstate__(self) -> dict:
+        """Leave the data out when pickling, e.g. to send a fitter to workers
+        """
+        state = self.__dict__.copy()
+        state["data"] = None
+        return state
+
     def _get_time(self, period: str) -> np.ndarray:
         """Get an array of years from a given N and M
 
@@ -47,6 +60,26 @@ class BaseSequence:
             )
         return np.arange(start=syear, stop=eyear + 1)
 
+    def _set_option(self, name: str, value, default) -> None:
+        """Set an option which changes how the data are computed or stored
+
+        Options left at their default are kept out of `self.param`, so that
+        the cache file names of existing runs don't change as options are added.
+        """
+        self.options[name] = value
+        if value != default:
+            self.param[name] = value
+
+    def _get_tags(self) -> dict:
+        """Get the tags which identify this sequence in timing records
+        """
+        return {
+            "category": self.category,
+            "model_name": getattr(self, "model_name", ""),
+            "M": self.M,
+            "N": self.N,
+        }
+
     def _get_attributes(self) -> OrderedDict:
         """Get the key parameters of the data as an ordered dictionary.
 
@@ -69,17 +102,30 @@ class BaseSequence:
         """
         raise NotImplementedError  # implemented slightly differently for each sub class
 
-    def _to_file(self, data: xr.DataArray) -> None:
+    def _to_file(self, data: xr.DataArray, filename: str = None) -> None:
         """Save the model sequences to file
 
-        Create the desired parent directory and delete existing file with same name, if necessary, and then dump to file.
+        The data are written to a temporary file which then replaces any
+        existing file with the same name, so that the cache never holds a
+        partly written file, even if the write fails.
+
+        Parameters
+        ----------
+        data : the data to save
+        filename : where to save them (default: the cache file)
         """
         assert isinstance(data, xr.DataArray), "data must be data array"
 
         data.attrs = self._get_attributes()  # save all the model parameters
-        if os.path.isfile(self._get_filename()):
-            os.remove(self._get_filename())
-        data.to_netcdf(self._get_filename(), format="netCDF4", engine="netcdf4")
+        if filename is None:
+            filename = self._get_filename()
+        partial = "{}.{}.part".format(filename, uuid.uuid4().hex)
+        try:
+            data.to_netcdf(partial, format="netCDF4", engine="netcdf4")
+            os.replace(partial, filename)
+        finally:
+            if os.path.isfile(partial):
+                os.remove(partial)
 
     def _from_file(self) -> Tuple[xr.DataArray, bool]:
         """Get data from file
@@ -93,17 +139,59 @@ class BaseSequence:
         """
         raise NotImplementedError
 
-    def get_data(self) -> xr.DataArray:
-        """Get the data
+    def _read_cache(self, io=None) -> Tuple[xr.DataArray, bool]:
+        """Read the data from file, if they've been cached
+
+        Parameters
+        ----------
+        io : a `BackgroundIO` to read through (optional)
         """
+        tags = self._get_tags()
+        if io is not None:
+            io.raise_errors()
         try:
-            data, success = self._from_file()
+            with recorder.timer("_from_file", **tags):
+                if io is None:
+                    data, success = self._from_file()
+                else:
+                    data, success = io.read(self)
         except BaseException:
-            success = False
+            data, success = None, False
 
-        if not success:
-            data = self._calculate_all()
+        if success:
+            recorder.count("cache_hit", **tags)
+            recorder.count("bytes_read", os.path.getsize(self._get_filename()), **tags)
+        else:
+            recorder.count("cache_miss", **tags)
+        return data, success
+
+    def _write_cache(self, data: xr.DataArray, io=None) -> None:
+        """Write the data to file
+
+        Parameters
+        ----------
+        data : the data to write
+        io : a `BackgroundIO` to queue the write on (optional)
+        """
+        if io is not None:
+            io.write(self, data=data)
+            return
+        tags = self._get_tags()
+        with recorder.timer("_to_file", **tags):
             self._to_file(data=data)
-            success = True
+        recorder.count("bytes_written", os.path.getsize(self._get_filename()), **tags)
+
+    def get_data(self, io=None) -> xr.DataArray:
+        """Get the data
+
+        Parameters
+        ----------
+        io : a `BackgroundIO` to read and write the cache through (optional)
+        """
+        data, success = self._read_cache(io=io)
+        if not success:
+            with recorder.timer("_calculate_all", **self._get_tags()):
+                data = self._calculate_all()
+            self._write_cache(data=data, io=io)
 
         self.data = data
@@ -0,0 +1,49 @@
+"""Common random numbers for the predictive draws of the fitters
+
+Fitters which share a `crn_seed` draw their projections of a given
+synthetic sequence from the same innovations, so that differences between
+their bias and stdev aren't blurred by independent Monte Carlo noise.
+Each (seed, stream, sequence) has its own random stream, from which the
+simulations of each future year are drawn in turn, starting from year 1. A
+cell with a longer planning period therefore extends the innovations of a
+shorter one rather than replacing them (which fitter caches shared across
+M rely on); a different number of simulations draws different ones.
+"""
+
+from typing import Iterable
+import numpy as np
+
+STREAMS = ["normal", "uniform"]
+
+
+def common_random_numbers(
+    seed: int, stream: str, sequences: Iterable[int], n_sim: int, years: Iterable[int]
+) -> np.ndarray:
+    """Get the innovations of some sequences
+
+    Parameters
+    ----------
+    seed : the `crn_seed` of the fitters
+    stream : 'normal' for standard normal or 'uniform' for uniform(0, 1) draws
+    sequences : the labels of the sequences
+    n_sim : how many simulations
+    years : the (future) years, from 1
+
+    Returns
+    -------
+    the innovations, indexed [sequence, simulation, year]
+    """
+    if stream not in STREAMS:
+        raise ValueError("Invalid stream: {} not recognized".format(stream))
+    sequences, years = np.atleast_1d(sequences), np.atleast_1d(years)
+    if years.min() < 1:
+        raise ValueError("Common random numbers are drawn for years from 1")
+    size = (years.max(), n_sim)  # [year, simulation], drawn year by year
+    draws = np.empty((sequences.size,) + size)
+    for i, seq in enumerate(sequences):
+        rng = np.random.RandomState([seed, STREAMS.index(stream), seq])
+        if stream == "normal":
+            draws[i] = rng.standard_normal(size)
+        else:
+            draws[i] = rng.uniform(size=size)
+    return draws[:, years - 1].transpose(0, 2, 1)
@@ -0,0 +1,298 @@
+"""Adaptive choice of the (M, N) cells of an experiment
+
+The bias and stdev surfaces are smooth in M and N, so they don't need every
+cell of the grid. `run_adaptive_experiment` starts from the corners and the
+centre of the grid, fits a Gaussian process emulator to the cells computed
+so far (one per generator, fitter and statistic) and computes next the cell
+where the emulator is most uncertain, until it is within `tolerance`
+everywhere. Each cell's Monte Carlo standard error is its observation noise.
+"""
+
+from typing import Dict, List, Tuple
+import itertools
+import logging
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from .backgroundio import BackgroundIO
+from .instrument import recorder
+from .progress import reporter
+from .util import combine_results, get_bias_variance
+
+logger = logging.getLogger(__name__)
+
+STATISTICS = ["bias", "stdev"]
+LENGTH_SCALES = [0.2, 0.35, 0.5, 0.75, 1.0, 1.5]  # on the unit square
+SIGNAL_SCALES = [0.25, 1.0, 4.0]  # times the variance of the observations
+JITTER = 1e-8
+
+
+def _get_inputs(M: np.ndarray, N: np.ndarray, grid: pd.DataFrame) -> np.ndarray:
+    """Scale (log M, log N) to the unit square spanned by the grid
+    """
+    inputs = []
+    for values, full in [(M, grid["M"]), (N, grid["N"])]:
+        lower, upper = np.log(full.min()), np.log(full.max())
+        scale = upper - lower if upper > lower else 1.0
+        inputs.append((np.log(np.asarray(values, dtype=float)) - lower) / scale)
+    return np.stack(inputs, axis=1)
+
+
+def _kernel(x1: np.ndarray, x2: np.ndarray, length: np.ndarray, signal: float):
+    dist = ((x1[:, np.newaxis] - x2[np.newaxis]) / length) ** 2
+    return signal * np.exp(-0.5 * dist.sum(axis=-1))
+
+
+def fit_emulator(x: np.ndarray, y: np.ndarray, noise: np.ndarray) -> Dict:
+    """Fit a Gaussian process with a squared exponential kernel
+
+    The length scales (one per input) and signal variance are chosen on a
+    grid to maximize the marginal likelihood; the mean is the weighted mean.
+
+    Parameters
+    ----------
+    x : the inputs, indexed [cell, input]
+    y : the observations
+    noise : the variance of the observation noise of each cell
+    """
+    weight = 1 / (noise + JITTER)
+    mean = np.sum(weight * y) / np.sum(weight)
+    resid = y - mean
+    variance = max(np.var(y), np.mean(noise), JITTER)
+    best: Dict = {"loglik": -np.inf}
+    for length_m, length_n, scale in itertools.product(
+        LENGTH_SCALES, LENGTH_SCALES, SIGNAL_SCALES
+    ):
+        length = np.array([length_m, length_n])
+        cov = _kernel(x, x, length, scale * variance) + np.diag(noise + JITTER)
+        chol = np.linalg.cholesky(cov)
+        alpha = np.linalg.solve(chol.T, np.linalg.solve(chol, resid))
+        loglik = -0.5 * resid @ alpha - np.log(np.diag(chol)).sum()
+        if loglik > best["loglik"]:
+            best = {
+                "loglik": loglik,
+                "x": x,
+                "mean": mean,
+                "length": length,
+                "signal": scale * variance,
+                "chol": chol,
+                "alpha": alpha,
+            }
+    return best
+
+
+def predict_emulator(emulator: Dict, x: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """The predictive mean and standard deviation of the emulator
+
+    Parameters
+    ----------
+    emulator : the output of `fit_emulator`
+    x : the inputs, indexed [cell, input]
+    """
+    cross = _kernel(x, emulator["x"], emulator["length"], emulator["signal"])
+    mean = emulator["mean"] + cross @ emulator["alpha"]
+    proj = np.linalg.solve(emulator["chol"], cross.T)
+    variance = np.maximum(emulator["signal"] - (proj ** 2).sum(axis=0), 0)
+    return mean, np.sqrt(variance)
+
+
+def _initial_cells(grid: pd.DataFrame) -> List[Tuple[int, int]]:
+    """The cells of the grid nearest its corners and its centre
+
+    The grid need not be a full product of M and N, so each corner (and the
+    centre) is snapped to the nearest (M, N) cell which is in it.
+    """
+    Ms, Ns = np.sort(grid["M"].unique()), np.sort(grid["N"].unique())
+    wanted = [(M, N) for M in [Ms[0], Ms[-1]] for N in [Ns[0], Ns[-1]]]
+    wanted.append((Ms[Ms.size // 2], Ns[Ns.size // 2]))
+    cells = list(grid[["M", "N"]].drop_duplicates().itertuples(index=False, name=None))
+    x_cells = _get_inputs([c[0] for c in cells], [c[1] for c in cells], grid)
+    x_wanted = _get_inputs([c[0] for c in wanted], [c[1] for c in wanted], grid)
+    nearest = [
+        cells[np.argmin(((x_cells - x) ** 2).sum(axis=1))] for x in x_wanted
+    ]
+    return list(dict.fromkeys(nearest))  # drop duplicates, keep the order
+
+
+def _get_noise(std_error: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """The observation noise of each cell, from its standard error
+
+    Cells without a finite standard error (e.g. with a single sequence) get
+    the largest noise of the others, or the variance of the values if none
+    has one.
+    """
+    noise = np.asarray(std_error, dtype=float) ** 2
+    finite = np.isfinite(noise)
+    if finite.any():
+        fallback = noise[finite].max()
+    else:
+        fallback = np.var(values) if values.size > 1 else 0.0
+    return np.where(finite, noise, fallback)
+
+
+def run_adaptive_experiment(
+    param_df,
+    n_seq,
+    n_mcsim,
+    threshold,
+    tolerance,
+    max_cells=None,
+    n_boot=0,
+    ci_level=0.95,
+    timing_file=None,
+    status_file=None,
+    mc_tolerance=None,
+    batch_size=100,
+    min_batches=2,
+    background_io=False,
+    max_pending_writes=2,
+):
+    """Like `run_experiment`, but only compute the (M, N) cells needed
+
+    After the initial cells, the (M, N) cell with the largest emulator
+    standard deviation (over generators, fitters and statistics) is computed
+    for every generator and fitter, until the largest standard deviation is
+    below `tolerance` or `max_cells` cells have been computed.
+
+    Returns the results of every cell of `param_df`: computed values where
+    they were computed and emulated values elsewhere, with `computed`
+    telling them apart and `bias_emulator_sd` and `stdev_emulator_sd` giving
+    the uncertainty of the emulated values (zero where computed). The other
+    columns of `run_experiment` (standard errors, `n_seq` and, if `n_boot` is
+    positive, the bootstrap confidence intervals) are given for the computed
+    cells only.
+
+    `mc_tolerance`, `batch_size` and `min_batches` are the `tolerance`,
+    `batch_size` and `min_batches` of `run_experiment` (the Monte Carlo
+    standard error at which each cell stops fitting sequences), and
+    `background_io` and `max_pending_writes` work as they do there.
+    """
+    grid = param_df.assign(
+        Generating_Function=[gen.model_name for gen in param_df["generator"]],
+        Fitting_Function=[fit.model_name for fit in param_df["fitter"]],
+    )
+    cells = grid[["M", "N"]].drop_duplicates()
+    cells = list(cells.itertuples(index=False, name=None))
+    max_cells = len(cells) if max_cells is None else min(max_cells, len(cells))
+
+    # the plan is every cell, so the ETA is an upper bound
+    recorder.reset()
+    reporter.start(
+        plan=[(fitter.model_name, n_seq) for fitter in grid["fitter"]],
+        status_file=status_file,
+    )
+
+    io = BackgroundIO(max_pending=max_pending_writes) if background_io else None
+    result_list: List = []
+    done: List[Tuple[int, int]] = []
+    queue = _initial_cells(grid)
+    try:
+        while len(done) < max_cells:
+            if len(queue) == 0:
+                results = combine_results(result_list)
+                sd = _emulate(results, grid, cells, done)[1]
+                worst = max(sd.items(), key=lambda item: item[1])
+                logger.info(
+                    "Largest emulator sd %.4f at (M, N) = %s", worst[1], worst[0]
+                )
+                if worst[1] < tolerance:
+                    break
+                queue = [worst[0]]
+            cell = queue.pop(0)
+            rows = grid[(grid["M"] == cell[0]) & (grid["N"] == cell[1])]
+            for i, row in rows.iterrows():
+                result_list.append(
+                    get_bias_variance(
+                        generator=row["generator"],
+                        fitter=row["fitter"],
+                        threshold=threshold,
+                        tolerance=mc_tolerance,
+                        batch_size=batch_size,
+                        io=io,
+                        n_boot=n_boot,
+                        ci_level=ci_level,
+                        min_batches=min_batches,
+                    )
+                )
+                reporter.end_cell()
+            done.append(cell)
+    finally:
+        if io is not None:
+            io.close()
+
+    results = combine_results(result_list)
+    emulated = _emulate(results, grid, cells, done)[0]
+
+    summary = recorder.summary()
+    logger.info("Time spent in each stage:\n%s", summary.to_string())
+    if timing_file is not None:
+        summary.to_csv(timing_file)
+    return emulated
+
+
+def _emulate(
+    results: xr.Dataset, grid: pd.DataFrame, cells: list, done: list
+) -> Tuple[xr.Dataset, Dict]:
+    """Fill in every cell of the grid from the computed ones
+
+    Returns the filled in results and the largest emulator standard
+    deviation of each cell which hasn't been computed yet.
+    """
+    Ms = np.sort(grid["M"].unique())
+    Ns = np.sort(grid["N"].unique())
+    coords = {
+        "M": Ms,
+        "N": Ns,
+        "Generating_Function": np.sort(grid["Generating_Function"].unique()),
+        "Fitting_Function": np.sort(grid["Fitting_Function"].unique()),
+    }
+    shape = tuple(len(val) for val in coords.values())
+    dims = list(coords.keys())
+    filled = xr.Dataset(coords=coords)
+    for stat in STATISTICS:
+        filled[stat] = (dims, np.full(shape, np.nan))
+        filled["{}_emulator_sd".format(stat)] = (dims, np.full(shape, np.nan))
+    filled["computed"] = (dims, np.zeros(shape, dtype=bool))
+    # the other columns (standard errors, intervals, ...) aren't emulated
+    for name in results.data_vars:
+        if name not in STATISTICS:
+            filled[name] = results[name].reindex(coords).transpose(*dims)
+
+    todo = [cell for cell in cells if cell not in done]
+    worst_sd = {cell: 0.0 for cell in todo}
+    x_all = _get_inputs([c[0] for c in cells], [c[1] for c in cells], grid)
+    for gen_name in coords["Generating_Function"]:
+        for fit_name in coords["Fitting_Function"]:
+            pair = {"Generating_Function": gen_name, "Fitting_Function": fit_name}
+            if any(pair[key] not in results[key].values for key in pair):
+                continue
+            observed = results.sel(**pair).stack(cell=["M", "N"])
+            observed = observed.dropna(dim="cell", subset=["bias"])
+            if observed["cell"].size == 0:
+                continue
+            x_obs = _get_inputs(observed["M"].values, observed["N"].values, grid)
+            for stat in STATISTICS:
+                values = observed[stat].values
+                finite = np.isfinite(values)
+                if not finite.any():
+                    continue
+                emulator = fit_emulator(
+                    x_obs[finite],
+                    values[finite],
+                    noise=_get_noise(
+                        observed["{}_se".format(stat)].values[finite], values[finite]
+                    ),
+                )
+                mean, sd = predict_emulator(emulator, x_all)
+                for (M, N), val, val_sd in zip(cells, mean, sd):
+                    loc = dict(pair, M=M, N=N)
+                    if (M, N) in done:
+                        val = results[stat].sel(**loc).values
+                        val_sd = 0.0
+                    else:
+                        worst_sd[(M, N)] = max(worst_sd[(M, N)], val_sd)
+                    filled[stat].loc[loc] = val
+                    filled["{}_emulator_sd".format(stat)].loc[loc] = val_sd
+                    filled["computed"].loc[loc] = (M, N) in done
+    return filled, worst_sd
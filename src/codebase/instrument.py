@@ -0,0 +1,101 @@
+"""Timers and counters for the stages of an experiment
+
+Every record is tagged with the (category, model_name, M, N) of the
+sequence that produced it, so that a summary shows where the walltime of
+a grid went. Use the module-level `recorder`.
+"""
+
+from contextlib import contextmanager
+from typing import Callable, List
+import json
+import logging
+import time
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+TAGS = ["category", "model_name", "M", "N"]
+
+
+class Recorder:
+    """Collect timing and counter records
+    """
+
+    def __init__(self) -> None:
+        self.records: List[dict] = []
+
+    def reset(self) -> None:
+        """Forget all records
+        """
+        self.records = []
+
+    def extend(self, records: List[dict]) -> None:
+        """Add records made elsewhere, e.g. by a worker process's `recorder`
+        """
+        self.records.extend(records)
+
+    def _add(self, stage: str, tags: dict, **values) -> None:
+        record = {"stage": stage}
+        record.update({tag: tags.get(tag) for tag in TAGS})
+        record.update(values)
+        self.records.append(record)
+        logger.debug(json.dumps(record, default=str))
+
+    @contextmanager
+    def timer(self, stage: str, **tags):
+        """Time the enclosed block
+
+        Parameters
+        ----------
+        stage : name of the stage, e.g. '_calculate_all'
+        tags : the (category, model_name, M, N) of the sequence
+        """
+        tic = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add(stage, tags, seconds=time.perf_counter() - tic, count=1)
+
+    def timed(self, func: Callable, stage: str, **tags) -> Callable:
+        """Wrap a function so that every call is timed
+        """
+
+        def wrapper(*args, **kwargs):
+            with self.timer(stage, **tags):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    def count(self, stage: str, value: int = 1, **tags) -> None:
+        """Increment a counter, e.g. cache hits or bytes written
+
+        Parameters
+        ----------
+        stage : name of the counter
+        value : how much to increment it by
+        tags : the (category, model_name, M, N) of the sequence
+        """
+        self._add(stage, tags, seconds=0.0, count=value)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """All records, one row each
+        """
+        return pd.DataFrame.from_records(
+            self.records, columns=["stage"] + TAGS + ["seconds", "count"]
+        )
+
+    def summary(self) -> pd.DataFrame:
+        """Total and mean time, and total count, of each stage per sequence
+        """
+        records = self.to_dataframe()
+        if records.shape[0] == 0:
+            return records
+        summary = records.groupby(TAGS + ["stage"]).agg(
+            seconds=("seconds", "sum"), count=("count", "sum"), calls=("count", "size")
+        )
+        summary["mean_seconds"] = summary["seconds"] / summary["calls"]
+        return summary
+
+
+# an importable value
+recorder = Recorder()
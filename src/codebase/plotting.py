@@ -0,0 +1,87 @@
+"""Plots which summarize many sequences at once
+
+A thousand sequences drawn one line at a time are slow to draw and
+unreadable. `fan_chart` instead reduces a [..., year] array to quantiles
+of each year in one step, and draws them as a few shaded bands. Any raw
+sequences asked for are drawn as a single `LineCollection`.
+"""
+
+from typing import Sequence
+import numpy as np
+import xarray as xr
+from matplotlib.collections import LineCollection
+
+from .storage import get_storage
+
+QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]  # symmetric, with the median in the middle
+N_DENSITY = 20  # how many bands to shade the density with
+
+
+def get_flows(data: xr.DataArray) -> xr.DataArray:
+    """Get the flows of a sequence or projection, decoding int16 storage
+    """
+    storage = get_storage(data)
+    if storage == "int16":
+        flows = np.exp(data * data["log_scale"] + data["log_offset"])
+        return flows.where(data != np.iinfo(np.int16).min)
+    if storage in ["exceedance", "lognormal"]:
+        raise ValueError("Flows aren't kept with {} storage".format(storage))
+    return data
+
+
+def to_lines(data: xr.DataArray, dim: str = "year") -> np.ndarray:
+    """Flatten every dimension but `dim`, to an array of lines [line, year]
+    """
+    others = [other for other in data.dims if other != dim]
+    return data.transpose(*others, dim).values.reshape(-1, data[dim].size)
+
+
+def fan_chart(
+    ax,
+    data: xr.DataArray,
+    quantiles: Sequence[float] = QUANTILES,
+    density: bool = False,
+    n_lines: int = 0,
+    color: str = "blue",
+    linewidth: float = 0.25,
+    rng=np.random,
+) -> None:
+    """Draw the quantiles of each year as shaded bands around the median
+
+    Parameters
+    ----------
+    ax : the axis to draw on
+    data : the flows, indexed by `year` and any other dimensions
+    quantiles : the quantiles which bound the bands, symmetric about 0.5
+    density : shade many thin bands instead, so the shading follows the density
+    n_lines : how many of the raw lines to draw on top, picked at random
+    color : the color of the bands and lines
+    linewidth : the width of the raw lines
+    rng : the random state which picks the raw lines
+    """
+    years = data["year"].values
+    lines = to_lines(data)
+    if density:
+        quantiles = np.linspace(0.025, 0.975, 2 * N_DENSITY + 1)
+    quantiles = np.sort(np.asarray(quantiles))
+    bounds = np.nanquantile(lines, quantiles, axis=0)  # [quantile, year]
+
+    n_band = quantiles.size // 2
+    for i in range(n_band):
+        alpha = (0.6 if density else 0.8) / n_band
+        ax.fill_between(
+            years, bounds[i], bounds[-(i + 1)], color=color, alpha=alpha, linewidth=0
+        )
+    if quantiles.size % 2 == 1:
+        ax.plot(years, bounds[n_band], color=color, linewidth=1.5)
+
+    if n_lines >= lines.shape[0]:
+        picks = np.arange(lines.shape[0])
+    else:
+        picks = rng.choice(lines.shape[0], size=n_lines, replace=False)
+    if picks.size > 0:
+        segments = np.stack(
+            [np.broadcast_to(years, (picks.size, years.size)), lines[picks]], axis=-1
+        )
+        ax.add_collection(LineCollection(segments, colors=color, linewidths=linewidth))
+    ax.set_xlim(years.min(), years.max())
@@ -0,0 +1,149 @@
+"""Progress and ETA reporting for long experiment runs
+
+The module-level `reporter` is started by `run_experiment` with the plan of
+cells to run. Fitters report each sequence they fit, and a one-line status
+is appended to a status file (and logged) at most every `interval` seconds,
+so that a run can be followed with `tail -f` from the login node. Lines
+carry a worker id, so several workers can share one status file.
+"""
+
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def get_worker_id() -> str:
+    """Identify this process: the SLURM task id if there is one, else the pid
+    """
+    return os.environ.get("SLURM_PROCID", str(os.getpid()))
+
+
+class ProgressReporter:
+    """Keep track of cells and fits done, and extrapolate the time remaining
+    """
+
+    def __init__(self) -> None:
+        self.start()
+
+    def start(
+        self,
+        plan: List[Tuple[str, int]] = None,
+        status_file: str = None,
+        interval: float = 30,
+    ) -> None:
+        """Start reporting on a new run
+
+        Parameters
+        ----------
+        plan : the (model_name, n_seq) of every cell which will be run, in order
+        status_file : where to append status lines (default: only log them)
+        interval : minimum number of seconds between status lines
+        """
+        self.plan = [] if plan is None else list(plan)
+        self.status_file = status_file
+        self.interval = interval
+        self.worker = get_worker_id()
+        self.cells_done = 0
+        self.cell: Dict = OrderedDict()
+        self.seq_done = 0
+        self.n_seq = 0
+        self.rates: Dict[str, List[float]] = {}  # model_name -> [fits, seconds]
+        self._cell_tic = time.perf_counter()
+        self._last_report = 0.0
+
+    def start_cell(self, model_name: str, M: int, N: int, n_seq: int) -> None:
+        """A fitter is about to fit `n_seq` sequences
+        """
+        self.cell = OrderedDict([("model_name", model_name), ("M", M), ("N", N)])
+        self.seq_done = 0
+        self.n_seq = n_seq
+        self._cell_tic = time.perf_counter()
+        self.rates.setdefault(model_name, [0, 0.0])
+
+    def update(self, n: int = 1) -> None:
+        """`n` more sequences of the current cell have been fit
+        """
+        toc = time.perf_counter()
+        rate = self.rates.setdefault(self.cell.get("model_name", ""), [0, 0.0])
+        rate[0] += n
+        rate[1] += toc - self._cell_tic
+        self._cell_tic = toc
+        self.seq_done += n
+        if toc - self._last_report >= self.interval:
+            self.report()
+
+    def end_cell(self) -> None:
+        """A cell of the plan is done (whether it was fit or read from cache)
+        """
+        self.cells_done += 1
+        self.cell = OrderedDict()
+        self.seq_done = 0
+        self.n_seq = 0
+        self.report()
+
+    def fits_per_second(self, model_name: str = None) -> float:
+        """Measured throughput of one fitter, or of all of them together
+        """
+        if model_name is None:
+            fits = sum(rate[0] for rate in self.rates.values())
+            seconds = sum(rate[1] for rate in self.rates.values())
+        else:
+            fits, seconds = self.rates.get(model_name, [0, 0.0])
+        return fits / seconds if seconds > 0 else float("nan")
+
+    def eta(self) -> float:
+        """Seconds remaining, from the measured rate of each fitter
+
+        Fitters which haven't been timed yet are assumed to run at the
+        overall rate. Cells found in the cache will make this an overestimate.
+        """
+        overall = self.fits_per_second()
+        if self.cell:
+            remaining = [(self.cell["model_name"], self.n_seq - self.seq_done)]
+            remaining += self.plan[self.cells_done + 1 :]
+        else:
+            remaining = self.plan[self.cells_done :]
+        seconds = 0.0
+        for model_name, n_fit in remaining:
+            rate = self.fits_per_second(model_name)
+            rate = overall if not rate > 0 else rate
+            seconds += n_fit / rate if n_fit > 0 else 0.0
+        return seconds
+
+    def status(self) -> str:
+        """A one-line summary of the progress
+        """
+        eta = self.eta()
+        eta = str(timedelta(seconds=int(eta))) if eta == eta else "unknown"
+        line = "{} worker={} cells {}/{}".format(
+            datetime.now().isoformat(timespec="seconds"),
+            self.worker,
+            self.cells_done,
+            len(self.plan),
+        )
+        if self.cell:
+            line += " | {} M={} N={} seq {}/{}".format(
+                *self.cell.values(), self.seq_done, self.n_seq
+            )
+        line += " | {:.3g} fits/s | ETA {}".format(self.fits_per_second(), eta)
+        return line
+
+    def report(self) -> None:
+        """Log the status and append it to the status file
+        """
+        self._last_report = time.perf_counter()
+        line = self.status()
+        logger.info(line)
+        if self.status_file is not None:
+            # a single append per line, so that workers don't interleave
+            with open(self.status_file, "a") as file:
+                file.write(line + "\n")
+
+
+# an importable value
+reporter = ProgressReporter()
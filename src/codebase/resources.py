@@ -0,0 +1,98 @@
+"""Split a budget of cores between worker processes, stan chains and BLAS
+
+Left alone, every layer picks its own parallelism: pystan runs chains on
+all cores, BLAS starts a thread per core, and worker processes multiply
+both. With a `cores` budget, fitters instead use an `Allocation`:
+
+* engines which fit one sequence at a time run `workers` processes. A pool
+  worker can't start the processes of parallel stan chains, so chains only
+  run in parallel when there is a single worker (`max_workers=1`);
+* vectorized engines fit in one process, with all the cores as BLAS threads.
+
+BLAS threads are pinned with `threadpoolctl`, which changes the thread
+pools of libraries already loaded, in the running process and in each
+worker. The usual environment variables are set too, so that processes
+started afterwards (such as pystan's chains) begin with the same limit;
+setting them alone does nothing once numpy is imported.
+"""
+
+from typing import NamedTuple
+import logging
+import os
+from threadpoolctl import threadpool_limits
+
+logger = logging.getLogger(__name__)
+
+THREAD_VARIABLES = [
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+]
+
+
+class Allocation(NamedTuple):
+    """How a budget of cores is used"""
+
+    cores: int
+    workers: int  # worker processes
+    chain_jobs: int  # stan chains run in parallel within each fit
+    blas_threads: int  # BLAS threads per process
+
+    def describe(self) -> str:
+        return "{} cores: {} worker(s) x {} chain job(s) x {} BLAS thread(s)".format(
+            self.cores, self.workers, self.chain_jobs, self.blas_threads
+        )
+
+
+def get_core_budget() -> int:
+    """The cores this process may use: the SLURM allocation if any, else
+    the CPU affinity of the process
+    """
+    if "SLURM_CPUS_PER_TASK" in os.environ:
+        return int(os.environ["SLURM_CPUS_PER_TASK"])
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count()
+
+
+def allocate(
+    cores: int = None, chains: int = 1, max_workers: int = None, vectorized=False
+) -> Allocation:
+    """Split a budget of cores
+
+    Parameters
+    ----------
+    cores : the budget (default `get_core_budget()`)
+    chains : how many stan chains each fit samples
+    max_workers : the most worker processes to use
+    vectorized : whether all the sequences are fit at once, in one process
+    """
+    cores = get_core_budget() if cores is None else max(1, int(cores))
+    if vectorized:
+        return Allocation(cores=cores, workers=1, chain_jobs=1, blas_threads=cores)
+    workers = cores if max_workers is None else max(1, min(cores, max_workers))
+    if workers > 1:
+        return Allocation(
+            cores=cores, workers=workers, chain_jobs=1, blas_threads=cores // workers
+        )
+    chain_jobs = max(1, min(chains, cores))
+    return Allocation(
+        cores=cores,
+        workers=1,
+        chain_jobs=chain_jobs,
+        blas_threads=max(1, cores // chain_jobs),
+    )
+
+
+def limit_threads(n_threads: int) -> None:
+    """Pin the number of BLAS (and OpenMP) threads
+
+    Parameters
+    ----------
+    n_threads : how many threads
+    """
+    threadpool_limits(limits=n_threads)
+    for variable in THREAD_VARIABLES:
+        os.environ[variable] = str(n_threads)
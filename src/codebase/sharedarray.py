@@ -0,0 +1,72 @@
+"""Share read-only arrays with worker processes without copying them
+
+The parent process publishes an array once, as a memory-mapped `.npy` file
+(in `/dev/shm` where it exists, so it never touches the disk). Workers get
+a small picklable `SharedArray` handle and attach to it by file name: all
+of them then read the same pages, and slices are views rather than copies.
+"""
+
+import os
+import tempfile
+import uuid
+import numpy as np
+
+_attached: dict = {}  # the arrays this process has attached to, by file name
+
+
+def get_shared_dir() -> str:
+    """Get the folder where shared arrays are published
+    """
+    if os.path.isdir("/dev/shm"):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+class SharedArray:
+    """A handle on a published array
+    """
+
+    def __init__(self, filename: str, shape: tuple, dtype: str) -> None:
+        self.filename = filename
+        self.shape = shape
+        self.dtype = dtype
+
+    @classmethod
+    def publish(cls, array: np.ndarray, name: str = "array") -> "SharedArray":
+        """Copy an array to shared memory, once
+
+        Parameters
+        ----------
+        array : the array to share
+        name : a label for the file name
+        """
+        filename = os.path.join(
+            get_shared_dir(), "codebase-{}-{}.npy".format(name, uuid.uuid4().hex)
+        )
+        shared = np.lib.format.open_memmap(
+            filename, mode="w+", dtype=array.dtype, shape=array.shape
+        )
+        shared[...] = array
+        shared.flush()
+        del shared
+        return cls(filename=filename, shape=array.shape, dtype=array.dtype.str)
+
+    def attach(self) -> np.ndarray:
+        """Get a read-only view of the array, mapping it at most once per process
+        """
+        if self.filename not in _attached:
+            _attached[self.filename] = np.load(self.filename, mmap_mode="r")
+        return _attached[self.filename]
+
+    def release(self) -> None:
+        """Delete the array; processes which have attached to it keep their view
+        """
+        _attached.pop(self.filename, None)
+        if os.path.isfile(self.filename):
+            os.remove(self.filename)
+
+    def __enter__(self) -> "SharedArray":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.release()
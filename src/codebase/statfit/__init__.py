@@ -2,6 +2,7 @@
 """
 
 from .statfit import StatisticalModel
+from .stanfit import StanStatisticalModel
 from .stationary import LN2Stationary
 from .nonstationary import LN2LinearTrend
 from .hmm import TwoStateHMM
@@ -0,0 +1,215 @@
+"""Vectorized Baum-Welch for two-state Gaussian hidden Markov models
+
+All sequences and all random restarts are fit at once as arrays indexed
+[time, state, sequence, restart]. Emission densities and likelihoods are
+computed in log space and the recursions are scaled, so nothing underflows.
+"""
+
+from typing import Dict
+import numpy as np
+
+N_STATE = 2  # the forward and backward passes are written out for two states
+_LOG_2PI = np.log(2 * np.pi)
+
+
+def _log_emission(X: np.ndarray, means: np.ndarray, stds: np.ndarray) -> np.ndarray:
+    """Normal log density, indexed [time, state, sequence, restart]
+    """
+    z = (X[:, np.newaxis] - means) / stds
+    return -0.5 * (z ** 2 + _LOG_2PI) - np.log(stds)
+
+
+def _forward_backward(start, trans, log_b):
+    """Run the scaled forward and backward passes
+
+    The emission densities are rescaled by their maximum at each time and
+    the forward variables are normalized at each step, so the recursions
+    never under- or overflow; the log likelihood is accumulated from the
+    scale factors.
+
+    Parameters
+    ----------
+    start : the start probabilities [state, sequence, restart]
+    trans : the transition probabilities [state, state, sequence, restart]
+    log_b : the log emission densities [time, state, sequence, restart]
+
+    Returns
+    -------
+    the log likelihood [sequence, restart], the state posteriors [time,
+    state, sequence, restart] and the expected transition counts [state,
+    state, sequence, restart]
+    """
+    n_time = log_b.shape[0]
+    log_b_max = log_b.max(axis=1)
+    b = np.exp(log_b - log_b_max[:, np.newaxis])
+    alpha = np.empty_like(b)
+    beta = np.empty_like(b)
+    scale = np.empty_like(log_b_max)
+
+    alpha[0] = start * b[0]
+    scale[0] = alpha[0, 0] + alpha[0, 1]
+    alpha[0] /= scale[0]
+    for t in range(1, n_time):
+        for j in range(N_STATE):
+            alpha[t, j] = alpha[t - 1, 0] * trans[0, j] + alpha[t - 1, 1] * trans[1, j]
+        alpha[t] *= b[t]
+        scale[t] = alpha[t, 0] + alpha[t, 1]
+        alpha[t] /= scale[t]
+
+    beta[-1] = 1
+    for t in range(n_time - 2, -1, -1):
+        nxt = b[t + 1] * beta[t + 1] / scale[t + 1]
+        for i in range(N_STATE):
+            beta[t, i] = trans[i, 0] * nxt[0] + trans[i, 1] * nxt[1]
+
+    loglik = np.log(scale).sum(axis=0) + log_b_max.sum(axis=0)
+    gamma = alpha * beta
+    nxt = b[1:] * beta[1:] / scale[1:, np.newaxis]
+    xi_sum = np.stack(
+        [
+            [(alpha[:-1, i] * nxt[:, j]).sum(axis=0) for j in range(N_STATE)]
+            for i in range(N_STATE)
+        ]
+    )
+    return loglik, gamma, xi_sum * trans
+
+
+def _initialize(
+    X: np.ndarray, n_init: int, min_std: float, rng
+) -> Dict[str, np.ndarray]:
+    """Random starting points for each restart
+
+    The first restart puts the two means at the quartiles of each sequence;
+    the others put them at two randomly chosen observations.
+    """
+    n_seq, n_time = X.shape
+    picks = rng.randint(0, n_time, size=(N_STATE, n_seq, n_init))
+    means = np.sort(X[np.arange(n_seq)[:, np.newaxis], picks], axis=0)
+    means[:, :, 0] = np.percentile(X, [25, 75], axis=1)
+    stds = np.maximum(X.std(axis=1), min_std)[:, np.newaxis]
+    stay = rng.uniform(0.5, 0.95, size=(N_STATE, n_seq, n_init))
+    return {
+        "start": np.full((N_STATE, n_seq, n_init), 1 / N_STATE),
+        "trans": np.array([[stay[0], 1 - stay[0]], [1 - stay[1], stay[1]]]),
+        "means": means,
+        "stds": np.broadcast_to(stds, means.shape).copy(),
+    }
+
+
+def fit_gaussian_hmm(
+    X: np.ndarray,
+    n_init: int = 25,
+    pseudocount: float = 10,
+    max_iter: int = 100,
+    tol: float = 1e-6,
+    min_std: float = 1e-3,
+    rng=np.random,
+) -> Dict[str, np.ndarray]:
+    """Fit a two-state Gaussian HMM to each sequence by expectation-maximization
+
+    Parameters
+    ----------
+    X : the observations, indexed [sequence, time]
+    n_init : how many random restarts per sequence
+    pseudocount : added to the expected transition counts (and start counts)
+    max_iter : the maximum number of EM iterations
+    tol : stop once no restart improves its log likelihood by more than this
+    min_std : a lower limit on the standard deviation of each state
+    rng : the random number generator for the restarts
+
+    Returns
+    -------
+    the parameters of the best restart for each sequence: `start` [sequence,
+    state], `trans` [sequence, state, state], `means` and `stds` [sequence,
+    state], and `loglik` [sequence]
+    """
+    X = np.asarray(X, dtype=float)
+    param = _initialize(X, n_init=n_init, min_std=min_std, rng=rng)
+    Xt = np.repeat(X.T[:, :, np.newaxis], n_init, axis=2)  # [time, sequence, restart]
+    loglik_old = np.full(Xt.shape[1:], -np.inf)
+    for _ in range(max_iter):
+        loglik, gamma, xi_sum = _forward_backward(
+            start=param["start"],
+            trans=param["trans"],
+            log_b=_log_emission(Xt, means=param["means"], stds=param["stds"]),
+        )
+        # M step
+        start = gamma[0] + pseudocount
+        param["start"] = start / start.sum(axis=0)
+        trans = xi_sum + pseudocount
+        param["trans"] = trans / trans.sum(axis=1, keepdims=True)
+        weight = gamma.sum(axis=0)
+        means = (gamma * Xt[:, np.newaxis]).sum(axis=0) / weight
+        variance = (gamma * (Xt[:, np.newaxis] - means) ** 2).sum(axis=0) / weight
+        param["means"] = means
+        param["stds"] = np.maximum(np.sqrt(variance), min_std)
+
+        converged = np.all(loglik - loglik_old < tol)
+        loglik_old = loglik
+        if converged:
+            break
+
+    # pick the best restart of each sequence
+    loglik = _forward_backward(
+        start=param["start"],
+        trans=param["trans"],
+        log_b=_log_emission(Xt, means=param["means"], stds=param["stds"]),
+    )[0]
+    loglik = np.where(np.isfinite(loglik), loglik, -np.inf)
+    best = np.argmax(loglik, axis=1)
+    seq = np.arange(X.shape[0])
+    fitted = {
+        "start": param["start"][:, seq, best].T,
+        "trans": np.moveaxis(param["trans"][:, :, seq, best], -1, 0),
+        "means": param["means"][:, seq, best].T,
+        "stds": param["stds"][:, seq, best].T,
+        "loglik": loglik[seq, best],
+    }
+    # sequences where every restart failed get missing parameters
+    failed = ~np.isfinite(fitted["loglik"])
+    fitted["means"][failed] = np.nan
+    fitted["stds"][failed] = np.nan
+    return fitted
+
+
+def sample_gaussian_hmm(
+    param: Dict[str, np.ndarray],
+    n_sim: int,
+    length: int,
+    rng=np.random,
+    moments: bool = False,
+    uniform: np.ndarray = None,
+) -> np.ndarray:
+    """Draw sequences from fitted HMMs, starting from the start distribution
+
+    Parameters
+    ----------
+    param : the output of `fit_gaussian_hmm`
+    n_sim : how many sequences to draw from each HMM
+    length : how long each sequence is
+    rng : the random number generator
+    moments : if True, only draw the hidden states and return the mean and
+        standard deviation of the emission in each state
+    uniform : the uniform draws which pick the hidden states, indexed
+        [sequence, simulation, time] (drawn from `rng` if not given)
+
+    Returns
+    -------
+    the draws, indexed [sequence, simulation, time] (or [sequence,
+    simulation, time, moment] if `moments`)
+    """
+    n_seq = param["means"].shape[0]
+    seq = np.arange(n_seq)[:, np.newaxis]
+    if uniform is None:
+        uniform = rng.uniform(size=(n_seq, n_sim, length))
+    # state 1 if the uniform draw is above the probability of state 0
+    states = np.empty((n_seq, n_sim, length), dtype=int)
+    states[:, :, 0] = uniform[:, :, 0] > param["start"][:, np.newaxis, 0]
+    for t in range(1, length):
+        p_zero = param["trans"][seq, states[:, :, t - 1], 0]
+        states[:, :, t] = uniform[:, :, t] > p_zero
+    means = param["means"][seq[:, :, np.newaxis], states]
+    stds = param["stds"][seq[:, :, np.newaxis], states]
+    if moments:
+        return np.stack([means, stds], axis=-1)
+    return rng.normal(loc=means, scale=stds)
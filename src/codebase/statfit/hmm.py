@@ -1,14 +1,22 @@
-"""A Hidden Markov Model implemented in Pomegranate
+"""A Hidden Markov Model implemented in Pomegranate (or vectorized numpy)
 """
 
 import pomegranate as pm
 import numpy as np
+import xarray as xr
 
 from . import StatisticalModel
+from .baumwelch import fit_gaussian_hmm, sample_gaussian_hmm
+
+ENGINES = ["pomegranate", "numpy"]
 
 
 class TwoStateHMM(StatisticalModel):
     """A Hidden Markov Model implemented in pomegranate
+
+    With `engine="numpy"`, all the sequences (and all the restarts) are fit
+    at once by the vectorized Baum-Welch of `baumwelch.py`, `chunk_size`
+    sequences at a time to bound the memory use.
     """
 
     def __init__(self, **kwargs) -> None:
@@ -16,10 +24,55 @@ class TwoStateHMM(StatisticalModel):
             "pseudocount": kwargs.pop("pseudocount", 10),
             "n_init": kwargs.pop("n_init", 25),
         }
+        engine = kwargs.pop("engine", "pomegranate")
+        if engine not in ENGINES:
+            raise ValueError("Invalid engine: {} not recognized".format(engine))
         super().__init__(**kwargs)
         self.param.update(model_param)
+        self._set_option("engine", engine, default="pomegranate")
+        if engine == "pomegranate" and self._fits_moments():
+            raise ValueError(
+                "Analytic exceedance and common random numbers need the numpy engine"
+            )
         self.model_name = "Hidden Markov Model"
 
+    def _calculate_batch(self, sequences: np.ndarray) -> xr.DataArray:
+        """Fit some of the sequences, all at once with the numpy engine
+        """
+        if self.options["engine"] == "pomegranate":
+            return super()._calculate_batch(sequences)
+        return self._calculate_vectorized(sequences, fit_chunk=self._fit_chunk)
+
+    def _fit_chunk(self, data: np.ndarray, sequences: np.ndarray) -> np.ndarray:
+        """Fit many sequences at once with the numpy engine
+
+        Parameters
+        ----------
+        data : the historical data, indexed [sequence, year]
+        sequences : the labels of the sequences, for common random numbers
+        """
+        hmm_param = fit_gaussian_hmm(
+            np.log(data),
+            n_init=self.param.get("n_init"),
+            pseudocount=self.param.get("pseudocount"),
+        )
+        if self._fits_moments():
+            # the emissions are normal in log space given the hidden states
+            uniform = None
+            if self.options["crn_seed"] is not None:
+                uniform = self._get_innovations("uniform", sequences=sequences)
+            return sample_gaussian_hmm(
+                hmm_param,
+                n_sim=self.param.get("n_mcsim"),
+                length=self.M,
+                moments=True,
+                uniform=uniform,
+            )
+        samples = sample_gaussian_hmm(
+            hmm_param, n_sim=self.param.get("n_mcsim"), length=self.M
+        )
+        return np.exp(samples)
+
     def _calculate_one(self, data) -> np.ndarray:
         """Simulate a single sequence of annual maximum flood peaks using LN2
         """
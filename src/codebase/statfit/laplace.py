@@ -0,0 +1,160 @@
+"""A vectorized MAP + Laplace approximation to the posterior of `ln2-trend.stan`
+
+The likelihood only depends on `mu0`, `beta_mu` and `coeff_var` (`sigma0`
+and `beta_sigma` have no prior and don't enter the likelihood), so the
+approximation is a multivariate normal over (mu0, beta_mu, log(coeff_var)).
+All the sequences are handled at once, as arrays indexed [sequence, ...].
+"""
+
+from typing import Dict
+import numpy as np
+
+SIGMA_MIN = 0.05  # the lower limit on sigma in ln2-trend.stan
+N_PARAM = 3
+
+
+def _unpack(theta: np.ndarray):
+    return theta[:, 0:1], theta[:, 1:2], np.exp(theta[:, 2:3])
+
+
+def log_posterior_grad(
+    theta: np.ndarray, log_y: np.ndarray, time: np.ndarray, prior: Dict[str, float]
+):
+    """The log posterior density (up to a constant) and its gradient
+
+    Parameters
+    ----------
+    theta : (mu0, beta_mu, log(coeff_var)), indexed [sequence, parameter]
+    log_y : the log of the observations, indexed [sequence, time]
+    time : the time of each observation relative to the last one (<= 0)
+    prior : the hyperparameters passed to the stan model
+    """
+    mu0, beta_mu, coeff_var = _unpack(theta)
+    mu = mu0 + beta_mu * time
+    sigma_raw = coeff_var * mu
+    active = sigma_raw >= SIGMA_MIN
+    sigma = np.where(active, sigma_raw, SIGMA_MIN)
+    resid = log_y - mu
+    logp = np.sum(-np.log(sigma) - resid ** 2 / (2 * sigma ** 2), axis=1)
+
+    # d(logp)/d(sigma) * d(sigma)/d(mu), where the floor isn't active
+    dsigma = -1 / sigma + resid ** 2 / sigma ** 3
+    dmu = resid / sigma ** 2 + np.where(active, dsigma * coeff_var, 0)
+    grad = np.stack(
+        [
+            dmu.sum(axis=1),
+            (dmu * time).sum(axis=1),
+            np.where(active, dsigma * sigma, 0).sum(axis=1),
+        ],
+        axis=1,
+    )
+
+    # priors (the log-normal prior on coeff_var is normal on its log, with
+    # the Jacobian of the log transform cancelling the 1 / coeff_var)
+    means = np.array([prior["mu0_mean"], prior["beta_mu_mean"], prior["cv_logmean"]])
+    sds = np.array([prior["mu0_sd"], prior["beta_mu_sd"], prior["cv_logsd"]])
+    logp -= np.sum((theta - means) ** 2 / (2 * sds ** 2), axis=1)
+    grad -= (theta - means) / sds ** 2
+    return logp, grad
+
+
+def _hessian(theta, log_y, time, prior, step=1e-5) -> np.ndarray:
+    """Central differences of the analytic gradient, indexed [sequence, i, j]
+    """
+    hess = np.empty((theta.shape[0], N_PARAM, N_PARAM))
+    for i in range(N_PARAM):
+        delta = np.zeros(N_PARAM)
+        delta[i] = step
+        grad_up = log_posterior_grad(theta + delta, log_y, time, prior)[1]
+        grad_down = log_posterior_grad(theta - delta, log_y, time, prior)[1]
+        hess[:, i] = (grad_up - grad_down) / (2 * step)
+    return (hess + np.swapaxes(hess, 1, 2)) / 2
+
+
+def _precision(hess: np.ndarray, min_eig: float = 1e-6) -> np.ndarray:
+    """The negative Hessian, with eigenvalues clipped so it's positive definite
+    """
+    eigval, eigvec = np.linalg.eigh(-hess)
+    eigval = np.maximum(eigval, min_eig)
+    return np.einsum("sij,sj,skj->sik", eigvec, eigval, eigvec)
+
+
+def fit_laplace(
+    y: np.ndarray,
+    prior: Dict[str, float],
+    max_iter: int = 100,
+    tol: float = 1e-8,
+) -> Dict[str, np.ndarray]:
+    """Find the posterior mode of each sequence by damped Newton iterations
+
+    Parameters
+    ----------
+    y : the observations, indexed [sequence, time]
+    prior : the hyperparameters passed to the stan model
+    max_iter : the maximum number of Newton iterations
+    tol : stop once no mode moves by more than this
+
+    Returns
+    -------
+    the `mode` [sequence, parameter] and `cov` [sequence, parameter, parameter]
+    of the approximation, on the (mu0, beta_mu, log(coeff_var)) scale
+    """
+    log_y = np.log(np.asarray(y, dtype=float))
+    n_seq, n_time = log_y.shape
+    time = np.arange(1, n_time + 1) - n_time  # as in ln2-trend.stan
+
+    # start from a stationary fit
+    mean = log_y.mean(axis=1)
+    coeff_var = np.clip(log_y.std(axis=1) / np.abs(mean), 1e-3, None)
+    theta = np.stack([mean, np.zeros(n_seq), np.log(coeff_var)], axis=1)
+
+    logp, grad = log_posterior_grad(theta, log_y, time, prior)
+    for _ in range(max_iter):
+        precision = _precision(_hessian(theta, log_y, time, prior))
+        step = np.linalg.solve(precision, grad[..., np.newaxis])[..., 0]
+        # halve the step until the log posterior improves
+        scale = np.ones((n_seq, 1))
+        for _ in range(30):
+            proposal = theta + scale * step
+            logp_new, grad_new = log_posterior_grad(proposal, log_y, time, prior)
+            better = logp_new >= logp
+            if np.all(better):
+                break
+            scale[~better] /= 2
+        accept = logp_new >= logp
+        theta[accept] = proposal[accept]
+        logp[accept] = logp_new[accept]
+        grad[accept] = grad_new[accept]
+        if np.all(np.abs(scale * step) < tol):
+            break
+
+    precision = _precision(_hessian(theta, log_y, time, prior))
+    return {"mode": theta, "cov": np.linalg.inv(precision)}
+
+
+def sample_laplace(
+    laplace: Dict[str, np.ndarray], n_sim: int, M: int, rng=np.random
+) -> Dict[str, np.ndarray]:
+    """Draw the generated quantities of `ln2-trend.stan` from the approximation
+
+    Parameters
+    ----------
+    laplace : the output of `fit_laplace`
+    n_sim : how many draws per sequence
+    M : how many future years to draw
+    rng : the random number generator
+
+    Returns
+    -------
+    `mu`, `sigma` and `yhat`, each indexed [sequence, simulation, year]
+    """
+    n_seq = laplace["mode"].shape[0]
+    chol = np.linalg.cholesky(laplace["cov"])
+    z = rng.normal(size=(n_seq, n_sim, N_PARAM))
+    theta = laplace["mode"][:, np.newaxis] + np.einsum("sij,snj->sni", chol, z)
+    mu0, beta_mu, coeff_var = [theta[..., i : i + 1] for i in range(N_PARAM)]
+    coeff_var = np.exp(coeff_var)
+    mu = mu0 + beta_mu * np.arange(1, M + 1)
+    sigma = np.maximum(coeff_var * mu, SIGMA_MIN)
+    yhat = np.exp(rng.normal(loc=mu, scale=sigma))
+    return {"mu": mu, "sigma": sigma, "yhat": yhat}
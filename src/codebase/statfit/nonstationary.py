@@ -1,16 +1,29 @@
 """Nonstationary (linear trend) flood frequency analysis stan
 """
 
+from typing import List
+import copy
 import os
+import time
 import numpy as np
+import pandas as pd
+import xarray as xr
 
-from . import StatisticalModel
+from . import StanStatisticalModel
+from .laplace import fit_laplace, sample_laplace
 from ..path import data_path
-from ..util import compile_model
 
+ENGINES = ["nuts", "laplace"]
+PRIORS = ["mu0_mean", "mu0_sd", "beta_mu_mean", "beta_mu_sd", "cv_logmean", "cv_logsd"]
 
-class LN2LinearTrend(StatisticalModel):
+
+class LN2LinearTrend(StanStatisticalModel):
     """Lognormal Model with linear trend and constant CV
+
+    With `engine="laplace"`, the posterior of every sequence is approximated
+    by a normal distribution around its mode (see `laplace.py`), all at once,
+    instead of being sampled with NUTS. It's much faster and meant for
+    exploratory grids; `compare_engines` checks it against NUTS.
     """
 
     def __init__(self, **kwargs) -> None:
@@ -25,30 +38,86 @@ class LN2LinearTrend(StatisticalModel):
             "n_warmup": kwargs.pop("n_warmup", 1000),
             "n_chain": kwargs.pop("n_chain", 1),
         }
+        engine = kwargs.pop("engine", "nuts")
+        if engine not in ENGINES:
+            raise ValueError("Invalid engine: {} not recognized".format(engine))
         super().__init__(**kwargs)
         self.param.update(model_param)
+        self._set_option("engine", engine, default="nuts")
         self.model_name = "LN2 Linear Trend"
+        self.stan_name = "LN2-Linear-Trend"
+        self.stan_params = ["mu0", "beta_mu", "sigma0", "beta_sigma", "coeff_var"]
 
-    def _calculate_one(self, data) -> np.ndarray:
+    def _get_stan_data(self, data) -> dict:
         stan_data = {"y": data, "N": self.N, "M": self.M}
-        for param in [
-            "mu0_mean",
-            "mu0_sd",
-            "beta_mu_mean",
-            "beta_mu_sd",
-            "cv_logmean",
-            "cv_logsd",
-        ]:
+        for param in PRIORS:
             stan_data.update({"{}".format(param): self.param.get(param)})
-        stan_mod = compile_model(
-            filename=self.model_file, model_name="LN2-Linear-Trend"
-        )
-        n_iter: int = self.param.get("n_mcsim") + self.param.get("n_warmup")
-        fit = stan_mod.sampling(
-            data=stan_data,
-            iter=n_iter,
-            chains=self.param.get("n_chain"),
-            warmup=self.param.get("n_warmup"),
-        )
-        fit_dict = fit.extract(permuted=True)
+        return stan_data
+
+    def _calculate_one(self, data) -> np.ndarray:
+        fit_dict = self._sample(self._get_stan_data(data))
         return fit_dict["yhat"]
+
+    def _calculate_one_lognormal(self, data) -> np.ndarray:
+        fit_dict = self._sample(self._get_stan_data(data))
+        return np.stack([fit_dict["mu"], fit_dict["sigma"]], axis=-1)
+
+    def _calculate_batch(self, sequences: np.ndarray) -> xr.DataArray:
+        """Fit some of the sequences, all at once with the Laplace engine
+        """
+        if self.options["engine"] == "nuts":
+            return super()._calculate_batch(sequences)
+        return self._calculate_vectorized(sequences, fit_chunk=self._fit_chunk)
+
+    def _fit_chunk(self, data: np.ndarray, sequences: np.ndarray) -> np.ndarray:
+        """Fit many sequences at once with the Laplace engine
+
+        Parameters
+        ----------
+        data : the historical data, indexed [sequence, year]
+        sequences : the labels of the sequences (not needed)
+        """
+        prior = {param: self.param.get(param) for param in PRIORS}
+        laplace = fit_laplace(data, prior=prior)
+        draws = sample_laplace(laplace, n_sim=self.param.get("n_mcsim"), M=self.M)
+        if self._fits_moments():
+            return np.stack([draws["mu"], draws["sigma"]], axis=-1)
+        return draws["yhat"]
+
+    def compare_engines(
+        self, threshold: float, n_seq: int = 20, engines: List[str] = None
+    ) -> pd.DataFrame:
+        """Compare the bias and stdev of the engines on the first sequences
+
+        Nothing is cached. Each row also gives the standard errors of the
+        bias and stdev, to judge whether the engines really differ.
+
+        Parameters
+        ----------
+        threshold : what constitutes a flood
+        n_seq : how many sequences to fit with each engine
+        engines : which engines to compare (default all)
+        """
+        sequences = 1 + np.arange(n_seq)
+        results = []
+        for engine in ENGINES if engines is None else engines:
+            fitter = copy.copy(self)
+            fitter.options = dict(self.options, engine=engine)
+            fitter._pilots = []
+            fitter._adaptation = None
+            tic = time.perf_counter()
+            fitter.data = fitter._calculate_batch(sequences)
+            seconds = time.perf_counter() - tic
+            stats = fitter._sequence_statistics(threshold=threshold)
+            std_error = stats.std(dim="sequence", ddof=1) / np.sqrt(n_seq)
+            results.append(
+                {
+                    "engine": engine,
+                    "bias": stats["bias"].mean().values - 0,
+                    "stdev": stats["stdev"].mean().values - 0,
+                    "bias_se": std_error["bias"].values - 0,
+                    "stdev_se": std_error["stdev"].values - 0,
+                    "seconds": seconds,
+                }
+            )
+        return pd.DataFrame(results).set_index("engine")
@@ -0,0 +1,95 @@
+"""A base class for fits which sample their posterior with stan
+"""
+
+from typing import Dict, List
+import numpy as np
+
+from . import StatisticalModel
+from ..util import compile_model
+
+
+class StanStatisticalModel(StatisticalModel):
+    """Sample the posterior of a stan model for each sequence
+
+    All the sequences of a fitter come from the same generator, so their
+    posteriors have a very similar geometry. With `n_pilot` > 0 the first
+    `n_pilot` sequences are sampled with the full `n_warmup`, and the step
+    size, inverse metric and posterior means they adapted to are reused for
+    the others. These then only take `n_warmup_short` warmup iterations,
+    with adaptation switched off, so that the sampler is a fixed (valid)
+    Markov chain kernel and the warmup only serves as burn-in.
+    """
+
+    def __init__(self, **kwargs) -> None:
+        n_pilot = kwargs.pop("n_pilot", 0)
+        n_warmup_short = kwargs.pop("n_warmup_short", 100)
+        super().__init__(**kwargs)
+        self._set_option("n_pilot", n_pilot, default=0)
+        self._set_option(
+            "n_warmup_short", n_warmup_short if n_pilot > 0 else 100, default=100
+        )
+        # child classes set `model_file`, `stan_name` and `stan_params`
+        # (the parameters to initialize)
+        self._pilots: List[Dict] = []
+        self._adaptation: Dict = None
+
+    def _get_adaptation(self, fit) -> Dict:
+        """Get the step size, inverse metric and posterior means of a fit
+        """
+        draws = fit.extract(pars=self.stan_params, permuted=True)
+        return {
+            "stepsize": np.mean(fit.get_stepsize()),
+            "inv_metric": np.mean(fit.get_inv_metric(), axis=0),
+            "init": {par: np.mean(draws[par], axis=0) for par in self.stan_params},
+        }
+
+    def _update_adaptation(self, fit) -> None:
+        """Keep the adaptation of the pilot fits, and average it once they're done
+        """
+        self._pilots.append(self._get_adaptation(fit))
+        if len(self._pilots) == self.options["n_pilot"]:
+            self._adaptation = {
+                "stepsize": np.median([pilot["stepsize"] for pilot in self._pilots]),
+                "inv_metric": np.mean(
+                    [pilot["inv_metric"] for pilot in self._pilots], axis=0
+                ),
+                "init": {
+                    par: np.mean([pilot["init"][par] for pilot in self._pilots], axis=0)
+                    for par in self.stan_params
+                },
+            }
+
+    def _sample(self, stan_data: dict) -> dict:
+        """Sample the posterior and return the draws of every variable
+
+        Parameters
+        ----------
+        stan_data : the data block of the stan model
+        """
+        stan_mod = compile_model(filename=self.model_file, model_name=self.stan_name)
+        n_chain = self.param.get("n_chain")
+        if self._adaptation is None:
+            n_warmup = self.param.get("n_warmup")
+            warm_start: dict = {}
+        else:
+            n_warmup = self.options["n_warmup_short"]
+            warm_start = {
+                "init": [self._adaptation["init"]] * n_chain,
+                "control": {
+                    "stepsize": self._adaptation["stepsize"],
+                    "inv_metric": self._adaptation["inv_metric"],
+                    "adapt_engaged": False,
+                },
+            }
+        if self.allocation is not None:
+            warm_start["n_jobs"] = self.allocation.chain_jobs
+        fit = stan_mod.sampling(
+            data=stan_data,
+            iter=self.param.get("n_mcsim") + n_warmup,
+            chains=n_chain,
+            warmup=n_warmup,
+            **warm_start
+        )
+        if self._adaptation is None and self.options["n_pilot"] > 0:
+            self._update_adaptation(fit)
+        return fit.extract(permuted=True)
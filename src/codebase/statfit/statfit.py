@@ -2,29 +2,129 @@
 """
 
 from hashlib import md5
+import logging
+import multiprocessing
 import os
+import dask
+from dask.utils import parse_bytes
 import xarray as xr
 import numpy as np
 import matplotlib.pyplot as plt
-from typing import Dict, Tuple
+from typing import Tuple
 import pandas as pd
 
-from ..path import cache_path
 from ..core import BaseSequence
+from ..crn import common_random_numbers
+from ..instrument import recorder
+from ..plotting import fan_chart, get_flows
+from ..progress import reporter
+from ..resources import Allocation, allocate, limit_threads
+from ..sharedarray import SharedArray
+from ..storage import (
+    STORAGE,
+    encode,
+    exceedance_fraction,
+    format_thresholds,
+    lognormal_exceedance,
+)
 from ..synthetic import SyntheticFloodSequence
 
+logger = logging.getLogger(__name__)
+
+EXCEEDANCE = ["sampled", "analytic"]
+TEMPORARIES = 4  # copies of a chunk held at once while its exceedances are reduced
+BOOT_ELEMENTS = 2 ** 22  # resampled values held at once by the bootstrap
+
+_worker: dict = {}  # the fitter and shared historical data of a worker process
+
+
+def _init_worker(fitter, shared: SharedArray, blas_threads: int = None) -> None:
+    np.random.seed()  # forked workers would otherwise all draw the same numbers
+    if blas_threads is not None:
+        limit_threads(blas_threads)
+    _worker["fitter"] = fitter
+    _worker["data"] = shared.attach()
+
+
+def _fit_shared(task):
+    """Fit one sequence in a worker process, reading its data in place
+
+    Returns the fit and the timing records made while fitting it, since the
+    worker's `recorder` is its own copy.
+    """
+    i, seq = task
+    fitter = _worker["fitter"]
+    recorder.reset()
+    with recorder.timer("_calculate_one", **fitter._get_tags()):
+        fit = fitter._fit_sequence(data=_worker["data"][i], sequence=seq)
+    return fit, recorder.records
+
 
 class StatisticalModel(BaseSequence):
     """A base class
     """
 
     def __init__(self, synthetic: SyntheticFloodSequence, **kwargs) -> None:
+        """Fit a statistical model to each synthetic sequence
+
+        Parameters
+        ----------
+        synthetic : the synthetic sequences to fit
+        n_mcsim : how many Monte Carlo draws to take for each sequence
+        storage : how to store the projections, see `codebase.storage`
+        thresholds : which thresholds to keep if `storage` is 'exceedance'
+        chunk_size : how many sequences vectorized engines fit at once
+        n_jobs : how many processes fit the sequences of engines which fit
+            them one at a time
+        cores : if given, a budget of cores to split between worker
+            processes (instead of `n_jobs`), stan chains and BLAS threads,
+            see `codebase.resources`
+        max_workers : the most worker processes to use with `cores`
+        memory_limit : if given (in bytes, or a string like '4GB'), cached
+            projections are opened lazily in chunks along `sequence` and
+            evaluated chunk by chunk, holding at most about this much at once
+        exceedance : 'sampled' compares flows drawn from the predictive
+            distribution with the threshold; 'analytic' keeps the log-normal
+            parameters of each draw instead and computes the exceedance
+            probability exactly (only for log-normal fitters). The synthetic
+            side is also computed exactly if the generator kept its moments.
+        crn_seed : if given, draw the projections of each sequence from
+            common random numbers (see `codebase.crn`), shared with every
+            other fitter using the same seed (only for log-normal fitters)
+        """
         super().__init__(
             M=synthetic.M, N=synthetic.N, category="StatisticalModel", **kwargs
         )
         model_param = {"n_mcsim": kwargs.pop("n_mcsim", 1000)}
         self.param.update(synthetic.param)
         self.param.update(model_param)
+        storage = kwargs.pop("storage", "float64")
+        if storage not in STORAGE:
+            raise ValueError("Invalid storage: {} not recognized".format(storage))
+        thresholds = format_thresholds(kwargs.pop("thresholds", None))
+        if storage != "exceedance":
+            thresholds = ""  # only used for exceedance storage
+        elif not thresholds:
+            raise ValueError("Exceedance storage needs at least one threshold")
+        self._set_option("storage", storage, default="float64")
+        self._set_option("thresholds", thresholds, default="")
+        self.chunk_size = kwargs.pop("chunk_size", 100)
+        self.n_jobs = kwargs.pop("n_jobs", 1)
+        self.cores = kwargs.pop("cores", None)
+        self.max_workers = kwargs.pop("max_workers", None)
+        self.allocation: Allocation = None
+        self._vectorized: bool = None  # the kind of fit `allocation` is for
+        memory_limit = kwargs.pop("memory_limit", None)
+        if isinstance(memory_limit, str):
+            memory_limit = parse_bytes(memory_limit)
+        self.memory_limit = memory_limit
+        exceedance = kwargs.pop("exceedance", "sampled")
+        if exceedance not in EXCEEDANCE:
+            raise ValueError("Invalid exceedance: {} not recognized".format(exceedance))
+        if exceedance == "analytic" and storage not in ["float64", "float32"]:
+            raise ValueError("Analytic exceedance needs float64 or float32 storage")
+        self._set_option("exceedance", exceedance, default="sampled")
+        self._set_option("crn_seed", kwargs.pop("crn_seed", None), default=None)
         self.synthetic = synthetic
         self.model_name = ""
 
@@ -39,34 +139,295 @@ class StatisticalModel(BaseSequence):
         """
         raise NotImplementedError
 
-    def _calculate_all(self) -> xr.DataArray:
-        """Just loop through and combine
+    def _calculate_one_lognormal(self, data) -> np.ndarray:
+        """Implemented by log-normal fitters for analytic exceedance and
+        common random numbers. Should return a numpy array indexed
+        [simulation, year, moment] where moment is the (mu, sigma) of the
+        log-flow of each draw
+
+        Parameters
+        ----------
+        data : the historical data
+        """
+        raise NotImplementedError(
+            "{} doesn't return log-normal moments".format(self.model_name)
+        )
+
+    def _fits_moments(self) -> bool:
+        """Whether fits return log-normal moments rather than flows
+        """
+        return (
+            self.options["exceedance"] == "analytic"
+            or self.options["crn_seed"] is not None
+        )
+
+    def _get_innovations(self, stream: str, sequences) -> np.ndarray:
+        """Get the common random numbers of some sequences
+
+        Parameters
+        ----------
+        stream : see `codebase.crn.STREAMS`
+        sequences : the labels of the sequences
+        """
+        return common_random_numbers(
+            seed=self.options["crn_seed"],
+            stream=stream,
+            sequences=sequences,
+            n_sim=self.param.get("n_mcsim"),
+            years=self._get_time("future"),
+        )
+
+    def _draw_flows(self, moments: np.ndarray, sequences) -> np.ndarray:
+        """Turn log-normal moments into flows, unless exceedance is analytic
+
+        Parameters
+        ----------
+        moments : the fits, indexed [sequence, simulation, year, moment]
+        sequences : the labels of the sequences
+        """
+        if self.options["exceedance"] == "analytic":
+            return moments
+        z = self._get_innovations("normal", sequences=sequences)
+        return np.exp(moments[..., 0] + moments[..., 1] * z)
+
+    def _calculate_batch(self, sequences: np.ndarray) -> xr.DataArray:
+        """Fit some of the sequences and combine them
+
+        Parameters
+        ----------
+        sequences : the labels of the sequences to fit
         """
         if self.synthetic.data is None:
             self.synthetic.get_data()
 
-        input_data = self.synthetic.data.sel(year=self._get_time("historical"))
-        sequences = 1 + np.arange(self.param.get("n_seq"))
-        simulations = 1 + np.arange(self.param.get("n_mcsim"))
-        fits = xr.concat(
-            [
-                xr.DataArray(
-                    data=self._calculate_one(data=input_data.sel(sequence=seq).values),
-                    coords={
-                        "year": self._get_time("future"),
-                        "simulation": simulations,
-                    },
-                    dims=["simulation", "year"],
-                    name="Statistical Monte Carlo Projection",
-                )
-                for seq in sequences
-            ],
-            dim="sequence",
+        input_data = self.synthetic.data.sel(
+            year=self._get_time("historical"), sequence=sequences
+        ).transpose("sequence", "year")
+        self._allocate()
+        if self._get_workers() > 1:
+            fits = self._fit_parallel(input_data.values, sequences=sequences)
+        else:
+            fit_sequence = recorder.timed(
+                self._fit_sequence, "_calculate_one", **self._get_tags()
+            )
+            fits = []
+            for data, seq in zip(input_data.values, sequences):
+                fits.append(fit_sequence(data=data, sequence=seq))
+                reporter.update()
+
+        fits = xr.concat([self._to_dataarray(fit) for fit in fits], dim="sequence")
+        fits["sequence"] = sequences
+        return fits
+
+    def _allocate(self, vectorized: bool = False) -> None:
+        """Split the `cores` budget, if any, for the coming fits and pin BLAS
+
+        This is done once, unless the kind of fit changes.
+
+        Parameters
+        ----------
+        vectorized : whether the sequences are fit all at once
+        """
+        if self.cores is None or self._vectorized == vectorized:
+            return
+        self._vectorized = vectorized
+        self.allocation = allocate(
+            cores=self.cores,
+            chains=self.param.get("n_chain", 1),
+            max_workers=self.max_workers,
+            vectorized=vectorized,
         )
+        limit_threads(self.allocation.blas_threads)
+        logger.info("%s: %s", self.model_name, self.allocation.describe())
+
+    def _get_workers(self) -> int:
+        """How many processes fit the sequences
+        """
+        return self.n_jobs if self.allocation is None else self.allocation.workers
+
+    def _fit_sequence(self, data: np.ndarray, sequence: int) -> np.ndarray:
+        """Fit a single sequence and draw its projection
+
+        Parameters
+        ----------
+        data : the historical data of the sequence
+        sequence : the label of the sequence
+        """
+        if self._fits_moments():
+            fit = self._calculate_one_lognormal(data=data)
+            return self._draw_flows(fit[np.newaxis], sequences=[sequence])[0]
+        return self._calculate_one(data=data)
+
+    def _fit_parallel(self, data: np.ndarray, sequences: np.ndarray) -> list:
+        """Fit the sequences in worker processes
+
+        The historical data are published once as a shared array, and each
+        worker gets a copy of the fitter (without any data) when it starts.
+        Tasks are then just (index, label) pairs, and workers fit views of
+        the shared array. Each worker adapts its own stan pilots, if any.
+        The timing records of each fit come back with it and are added to
+        the `recorder` of this process.
+
+        Parameters
+        ----------
+        data : the historical data, indexed [sequence, year]
+        sequences : the labels of the sequences
+        """
+        fits = []
+        shared = SharedArray.publish(np.ascontiguousarray(data), name="historical")
+        with shared:
+            blas_threads = None
+            if self.allocation is not None:
+                blas_threads = self.allocation.blas_threads
+            with multiprocessing.Pool(
+                self._get_workers(),
+                initializer=_init_worker,
+                initargs=(self, shared, blas_threads),
+            ) as pool:
+                with recorder.timer("_fit_parallel", **self._get_tags()):
+                    for fit, records in pool.imap(_fit_shared, enumerate(sequences)):
+                        fits.append(fit)
+                        recorder.extend(records)
+                        reporter.update()
+        return fits
+
+    def _calculate_vectorized(self, sequences: np.ndarray, fit_chunk) -> xr.DataArray:
+        """Fit some of the sequences with an engine which fits many at once
+
+        Parameters
+        ----------
+        sequences : the labels of the sequences to fit
+        fit_chunk : takes the historical data [sequence, year] of up to
+            `chunk_size` sequences, and their labels, and returns projections
+            [sequence, simulation, year] (or log-normal moments [sequence,
+            simulation, year, moment] if `_fits_moments()`)
+        """
+        if self.synthetic.data is None:
+            self.synthetic.get_data()
+        input_data = self.synthetic.data.sel(
+            year=self._get_time("historical"), sequence=sequences
+        ).transpose("sequence", "year")
+        self._allocate(vectorized=True)
+        fits = []
+        for start in range(0, sequences.size, self.chunk_size):
+            data = input_data.values[start : start + self.chunk_size]
+            chunk = sequences[start : start + self.chunk_size]
+            with recorder.timer("_fit_chunk", **self._get_tags()):
+                samples = fit_chunk(data, sequences=chunk)
+                if self._fits_moments():
+                    samples = self._draw_flows(samples, sequences=chunk)
+            fits += [self._to_dataarray(sample) for sample in samples]
+            reporter.update(data.shape[0])
+
+        fits = xr.concat(fits, dim="sequence")
         fits["sequence"] = sequences
+        return fits
+
+    def _to_dataarray(self, fit: np.ndarray) -> xr.DataArray:
+        """Label the projection of one sequence and convert it to the storage
+
+        Parameters
+        ----------
+        fit : the projection, indexed [simulation, year] (or [simulation,
+            year, moment] for analytic exceedance)
+        """
+        coords = {
+            "year": self._get_time("future"),
+            "simulation": 1 + np.arange(self.param.get("n_mcsim")),
+        }
+        dims = ["simulation", "year"]
+        if self.options["exceedance"] == "analytic":
+            coords["moment"] = ["mu", "sigma"]
+            dims.append("moment")
+        return encode(
+            xr.DataArray(
+                data=fit,
+                coords=coords,
+                dims=dims,
+                name="Statistical Monte Carlo Projection",
+            ),
+            storage=self.options["storage"],
+            thresholds=self.options["thresholds"],
+        )
+
+    def _calculate_all(self) -> xr.DataArray:
+        """Just loop through and combine
+        """
+        sequences = 1 + np.arange(self.param.get("n_seq"))
+        reporter.start_cell(
+            model_name=self.model_name, M=self.M, N=self.N, n_seq=sequences.size
+        )
+        fits = self._calculate_batch(sequences)
         fits.attrs = self._get_attributes()
         return fits
 
+    def get_data_adaptive(
+        self,
+        threshold: float,
+        tolerance: float,
+        batch_size: int = 100,
+        min_batches: int = 2,
+        io=None,
+    ) -> None:
+        """Get the data, fitting only as many sequences as needed
+
+        Sequences are fit in batches until the Monte Carlo standard errors of
+        both the bias and the stdev are below `tolerance` (or all `n_seq`
+        sequences are fit). It never stops before `min_batches` batches, while
+        a standard error is exactly zero (e.g. no exceedances yet of a rare
+        threshold), or, for stratified sequences, before every stratum has
+        two fitted sequences, since the estimates would drop the others.
+        Projections with fewer than `n_seq` sequences are not cached, since
+        they depend on the threshold and tolerance.
+
+        Parameters
+        ----------
+        threshold : what constitutes a flood
+        tolerance : the target standard error of the bias and stdev
+        batch_size : how many sequences to fit between checks
+        min_batches : how many batches to fit at least
+        io : a `BackgroundIO` to read and write the cache through (optional)
+        """
+        tags = self._get_tags()
+        data, success = self._read_cache(io=io)
+        if success:
+            self.data = data
+            return
+
+        sequences = 1 + np.arange(self.param.get("n_seq"))
+        reporter.start_cell(
+            model_name=self.model_name, M=self.M, N=self.N, n_seq=sequences.size
+        )
+        batches = []
+        for start in range(0, sequences.size, batch_size):
+            with recorder.timer("_calculate_batch", **tags):
+                batches.append(
+                    self._calculate_batch(sequences[start : start + batch_size])
+                )
+            self.data = xr.concat(batches, dim="sequence")
+            if len(batches) < min_batches or not self._covers_strata():
+                continue
+            std_error = self._summarize(self._sequence_statistics(threshold))[1]
+            std_error = [std_error["bias"].values, std_error["stdev"].values]
+            if 0 < min(std_error) and max(std_error) <= tolerance:
+                break
+
+        self.data.attrs = self._get_attributes()
+        if self.data["sequence"].size == sequences.size:
+            self._write_cache(data=self.data, io=io)
+
+    def _covers_strata(self) -> bool:
+        """Whether every stratum of the synthetic sequences has at least two
+        sequences among the projections (always, if they aren't stratified)
+        """
+        synthetic = self.synthetic.data
+        if "stratum" not in synthetic.coords:
+            return True
+        strata = np.unique(synthetic["stratum"].values)
+        labels = synthetic["stratum"].sel(sequence=self.data["sequence"]).values
+        counts = np.bincount(labels, minlength=strata.max() + 1)
+        return bool(np.all(counts[strata] >= 2))
+
     def _get_filename(self) -> str:
         """Get a file name
 
@@ -77,7 +438,9 @@ class StatisticalModel(BaseSequence):
         """
 
         attributes = self._get_attributes()
-        _ = [attributes.pop(var) for var in ["M"]]
+        if self.synthetic.shares_history():
+            # the projections of a longer M also serve shorter ones
+            attributes.pop("M")
 
         file_string = ""
         for key, val in attributes.items():
@@ -86,7 +449,7 @@ class StatisticalModel(BaseSequence):
         file_string = md5(file_string.encode("ascii")).hexdigest()
         file_string += ".nc"
 
-        file_dir = os.path.join(cache_path, self.category)
+        file_dir = os.path.join(self.cache_dir, self.category)
         file_dir = os.path.abspath(file_dir)
         if not os.path.isdir(file_dir):
             os.makedirs(file_dir)
@@ -108,6 +471,8 @@ class StatisticalModel(BaseSequence):
             success = False  # default assumption is no luck
             if (attr_desired == attr_observed) and (M_observed >= M_desired):
                 data = data.sel(year=slice(1 - self.N, M_desired))
+                if self.memory_limit is not None:
+                    data = data.chunk(self._get_chunks(data))
                 success = True  # we did it!
             else:
                 data = None  # no luck
@@ -118,35 +483,206 @@ class StatisticalModel(BaseSequence):
 
         return data, success
 
-    def evaluate(self, threshold: float) -> Dict[str, float]:
+    def lineplot(self, sequence: int = None, **kwargs) -> None:
+        """Plot the projections as a fan chart, with the synthetic flows
+
+        The quantiles of each future year are taken over all simulations (of
+        all sequences, or of one). Keyword arguments go to
+        `codebase.plotting.fan_chart`.
+
+        Parameters
+        ----------
+        sequence : only plot the projections of this sequence
+        """
+        if self.data is None:
+            self.get_data()
+        flows = get_flows(self.data.sel(year=self._get_time("future")))
+        observed = self.synthetic.data.sel(sequence=self.data["sequence"])
+        if sequence is not None:
+            flows = flows.sel(sequence=sequence)
+            observed = observed.sel(sequence=sequence)
+        observed = observed.load()
+        color = kwargs.pop("c", "blue")
+        fig, ax = plt.subplots(figsize=(10, 5), nrows=1, ncols=1)
+        fan_chart(ax, flows, color=color, **kwargs)
+        if sequence is not None:
+            ax.plot(observed["year"], observed, c="black", linewidth=1)
+        else:
+            fan_chart(ax, observed, quantiles=[0.05, 0.5, 0.95], color="gray")
+        ax.semilogy()
+        ax.set_title("{} fit to {}".format(self.model_name, self.synthetic.model_name))
+        fig.tight_layout()
+
+    def _get_chunks(self, data: xr.DataArray) -> dict:
+        """Chunk along `sequence` so that the chunks evaluated at once fit in
+        `memory_limit`
+        """
+        per_sequence = data.nbytes / data["sequence"].size
+        n_chunk = self.memory_limit // (
+            multiprocessing.cpu_count() * TEMPORARIES * per_sequence
+        )
+        return {"sequence": max(1, int(n_chunk))}
+
+    def evaluate(
+        self, threshold: float, n_boot: int = 0, ci_level: float = 0.95, seed=0
+    ) -> pd.DataFrame:
         """Evaluate the sucess of predictions
+
+        Parameters
+        ----------
+        threshold : what constitutes a flood
+        n_boot : how many bootstrap resamples of the sequences give the
+            confidence intervals of the bias and stdev (none if 0)
+        ci_level : the level of the confidence intervals
+        seed : seeds the bootstrap, which doesn't touch the global random state
         """
         if self.data is None:
             self.get_data()
 
+        with recorder.timer("evaluate", **self._get_tags()):
+            results = self._evaluate(
+                threshold=threshold, n_boot=n_boot, ci_level=ci_level, seed=seed
+            )
+        return results
+
+    def _sequence_statistics(self, threshold: float) -> xr.Dataset:
+        """The bias and stdev of each sequence, averaged over the future years
+
+        The bias and stdev of the whole experiment are the means of these
+        over `sequence`.
+        """
         future_estimates = self.data.sel(year=self._get_time("future"))
-        future_obs = self.synthetic.data.sel(year=self._get_time("future"))
-
-        bias = (future_estimates > threshold).mean().values - (
-            future_obs > threshold
-        ).mean().values
-        stdev = (
-            (future_estimates > threshold)
-            .std(dim="simulation")
-            .mean(dim=["sequence", "year"])
-            .values
+        future_obs = self.synthetic.data.sel(
+            year=self._get_time("future"), sequence=self.data["sequence"]
+        )
+
+        # the standard deviation of a boolean is sqrt(p * (1 - p))
+        p_exceed = exceedance_fraction(future_estimates, threshold=threshold)
+        if self.options["exceedance"] == "analytic" and "log_mu" in future_obs.coords:
+            obs_exceed = lognormal_exceedance(
+                future_obs["log_mu"], future_obs["log_sigma"], threshold=threshold
+            )
+        else:
+            obs_exceed = future_obs > threshold
+        bias = p_exceed.mean(dim="year") - obs_exceed.mean(dim="year")
+        stdev = np.sqrt(p_exceed * (1 - p_exceed)).mean(dim="year")
+        return xr.Dataset({"bias": bias, "stdev": stdev})
+
+    def _get_strata(self, stats: xr.Dataset) -> Tuple[np.ndarray, ...]:
+        """The stratum of each sequence of `stats`, the strata among them and
+        their shares (unstratified sequences are all in stratum 0)
+        """
+        synthetic = self.synthetic.data
+        if "stratum" not in synthetic.coords:
+            labels = np.zeros(stats["sequence"].size, dtype=int)
+            return labels, np.array([0]), np.array([1.0])
+        share = np.bincount(
+            synthetic["stratum"].values, weights=synthetic["weight"].values
         )
+        labels = synthetic["stratum"].sel(sequence=stats["sequence"]).values
+        strata = np.unique(labels)
+        return labels, strata, share[strata] / share[strata].sum()
+
+    def _bootstrap(
+        self, stats: xr.Dataset, n_boot: int, ci_level: float, seed
+    ) -> pd.DataFrame:
+        """Percentile bootstrap confidence intervals of the means of `stats`
+
+        The sequences are resampled (within their strata, if stratified)
+        `n_boot` times at once, by indexing with a matrix [resample,
+        sequence], in blocks of about `BOOT_ELEMENTS` values. As in
+        `_summarize`, a stratum with a single sequence borrows the spread of
+        all of them: its sequence plus a resampled deviation from the mean.
+        """
+        rng = np.random.RandomState(seed)
+        labels, strata, share = self._get_strata(stats)
+        values = np.stack([np.asarray(stat.values) for stat in stats.values()])
+        estimates = np.zeros((values.shape[0], n_boot))  # [statistic, resample]
+        deviations = values - values.mean(axis=-1, keepdims=True)
+        for stratum, weight in zip(strata, share):
+            members = np.flatnonzero(labels == stratum)
+            block = max(1, BOOT_ELEMENTS // (values.shape[0] * members.size))
+            for start in range(0, n_boot, block):
+                size = (min(block, n_boot - start), members.size)
+                if members.size > 1:
+                    index = members[rng.randint(members.size, size=size)]
+                    resampled = values[:, index].mean(axis=-1)  # [stat, resample]
+                else:
+                    index = rng.randint(labels.size, size=size[0])
+                    resampled = values[:, members] + deviations[:, index]
+                estimates[:, start : start + size[0]] += weight * resampled
+        alpha = (1 - ci_level) / 2
+        lower, upper = np.quantile(estimates, [alpha, 1 - alpha], axis=1)
+        intervals = {}
+        for i, name in enumerate(stats.keys()):
+            intervals["{}_lower".format(name)] = lower[i]
+            intervals["{}_upper".format(name)] = upper[i]
+        return pd.DataFrame(intervals, index=[0])
+
+    def _summarize(self, stats: xr.Dataset) -> Tuple[xr.Dataset, xr.Dataset]:
+        """The means over `sequence` of the statistics of each sequence, and
+        their standard errors
+
+        If the synthetic sequences were drawn from strata (they have `stratum`
+        and `weight` coordinates), the means are the stratified estimates
+        sum_h W_h mean_h, where W_h is the share of stratum h (the sum of the
+        weights of its sequences), so that they stay unbiased.
+        """
+        n_seq = stats["sequence"].size
+        if "stratum" not in self.synthetic.data.coords:
+            std_error = stats.std(dim="sequence", ddof=1) / np.sqrt(n_seq)
+            return stats.mean(dim="sequence"), std_error
+
+        labels, strata, share = self._get_strata(stats)
+        n_draws = np.array([np.sum(labels == h) for h in strata])
+        means, std_errors = {}, {}
+        for name, stat in stats.items():
+            values = np.asarray(stat.values)
+            mean = np.array([values[labels == h].mean() for h in strata])
+            # strata with a single sequence borrow the overall variance
+            variance = np.array(
+                [
+                    values[labels == h].var(ddof=1) if n > 1 else values.var(ddof=1)
+                    for h, n in zip(strata, n_draws)
+                ]
+            )
+            means[name] = share @ mean
+            std_errors[name] = np.sqrt(np.sum(share ** 2 * variance / n_draws))
+        return xr.Dataset(means), xr.Dataset(std_errors)
+
+    def _evaluate(
+        self, threshold: float, n_boot: int = 0, ci_level: float = 0.95, seed=0
+    ) -> pd.DataFrame:
+        """Compare the projections with the synthetic future
+        """
+        stats = self._sequence_statistics(threshold=threshold)
+        if self.data.chunks is not None:
+            # only the statistics of each sequence are ever held in memory
+            with dask.config.set(scheduler="threads"):
+                stats = stats.compute()
+        n_seq = stats["sequence"].size
+        mean, std_error = self._summarize(stats)
 
         results = pd.DataFrame(
             {
                 "N": self.N,
                 "M": self.M,
-                "bias": bias - 0,
-                "stdev": stdev - 0,
+                "bias": mean["bias"].values - 0,
+                "stdev": mean["stdev"].values - 0,
+                "bias_se": std_error["bias"].values - 0,
+                "stdev_se": std_error["stdev"].values - 0,
+                "n_seq": n_seq,
                 "Generating Function": self.synthetic.model_name,
                 "Fitting Function": self.model_name,
             },
             index=[0],
-        ).set_index(["N", "M"])
+        )
+        if n_boot > 0:
+            results = results.join(
+                self._bootstrap(stats, n_boot=n_boot, ci_level=ci_level, seed=seed)
+            )
+        results = results.set_index(["N", "M"])
+        if self.synthetic.scenario:
+            results["scenario"] = self.synthetic.get_scenario_label()
 
         return results
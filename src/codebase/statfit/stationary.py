@@ -1,11 +1,11 @@
 import os
+import numpy as np
 
-from . import StatisticalModel
+from . import StanStatisticalModel
 from ..path import data_path
-from ..util import compile_model
 
 
-class LN2Stationary(StatisticalModel):
+class LN2Stationary(StanStatisticalModel):
     def __init__(self, **kwargs) -> None:
         self.model_file = os.path.abspath(
             os.path.join(data_path, "ln2-stationary.stan")
@@ -21,9 +21,11 @@ class LN2Stationary(StatisticalModel):
         super().__init__(**kwargs)
         self.param.update(model_param)
         self.model_name = "LN2 Stationary"
+        self.stan_name = "LN2-Stationary"
+        self.stan_params = ["mu", "sigma"]
 
-    def _calculate_one(self, data):
-        stan_data = {
+    def _get_stan_data(self, data) -> dict:
+        return {
             "y": data,
             "N": self.N,
             "M": self.M,
@@ -32,12 +34,12 @@ class LN2Stationary(StatisticalModel):
             "sigma_mean": self.param.get("sigma_mean"),
             "sigma_sd": self.param.get("sigma_sd"),
         }
-        sm = compile_model(filename=self.model_file, model_name="LN2-Stationary")
-        fit = sm.sampling(
-            data=stan_data,
-            iter=self.param.get("n_mcsim") + self.param.get("n_warmup"),
-            chains=self.param.get("n_chain"),
-            warmup=self.param.get("n_warmup"),
-        )
-        fit_dict = fit.extract(permuted=True)
+
+    def _calculate_one(self, data):
+        fit_dict = self._sample(self._get_stan_data(data))
         return fit_dict["yhat"]
+
+    def _calculate_one_lognormal(self, data):
+        fit_dict = self._sample(self._get_stan_data(data))
+        moments = np.stack([fit_dict["mu"], fit_dict["sigma"]], axis=-1)
+        return np.repeat(moments[:, np.newaxis], self.M, axis=1)
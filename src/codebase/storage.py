@@ -0,0 +1,163 @@
+"""Compact representations of Monte Carlo projections
+
+Only exceedances of a threshold (and statistics of them) are ever computed
+from the projections, so they don't need to be kept as float64:
+
+* 'float64' : the flows, as computed
+* 'float32' : the flows in single precision
+* 'int16' : the log-flows quantized to int16, with a scale and offset per sequence
+* 'exceedance' : bit-packed booleans (along `simulation`) for given thresholds
+
+`exceedance_fraction` works directly on any of these. Lognormal fitters can
+also keep, instead of flows, the parameters (`mu`, `sigma`) of the
+predictive distribution of each draw and year, along a `moment` dimension,
+so that exceedance probabilities are computed exactly rather than sampled.
+"""
+
+from typing import List
+import numpy as np
+import xarray as xr
+from scipy.special import ndtr
+
+STORAGE = ["float64", "float32", "int16", "exceedance"]
+
+INT16_FILL = np.iinfo(np.int16).min  # marks missing values (failed fits)
+INT16_MAX = np.iinfo(np.int16).max
+
+# number of bits set in each possible byte
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+
+def parse_thresholds(thresholds) -> List[float]:
+    """Thresholds are saved in the file attributes as a comma-separated string
+    """
+    if thresholds is None:
+        return []
+    if isinstance(thresholds, str):
+        return [float(val) for val in thresholds.split(",") if val]
+    return [float(val) for val in np.atleast_1d(thresholds)]
+
+
+def format_thresholds(thresholds) -> str:
+    """The inverse of `parse_thresholds`
+    """
+    return ",".join("{:g}".format(val) for val in parse_thresholds(thresholds))
+
+
+def get_storage(data: xr.DataArray) -> str:
+    """Work out how a projection is stored
+    """
+    if "packed_simulation" in data.dims:
+        return "exceedance"
+    if "moment" in data.dims:
+        return "lognormal"
+    if data.dtype == np.int16:
+        return "int16"
+    if data.dtype == np.float32:
+        return "float32"
+    return "float64"
+
+
+def encode(data: xr.DataArray, storage: str, thresholds=None) -> xr.DataArray:
+    """Convert flows, indexed by `simulation` (and `year`), to a compact storage
+
+    Parameters
+    ----------
+    data : the flows
+    storage : one of `STORAGE`
+    thresholds : the thresholds to keep, only used for 'exceedance'
+    """
+    if storage == "float64":
+        return data
+    elif storage == "float32":
+        return data.astype(np.float32)
+    elif storage == "int16":
+        log_flow = np.log(data.values)
+        lower, upper = np.nanmin(log_flow), np.nanmax(log_flow)
+        offset = (upper + lower) / 2
+        scale = (upper - lower) / (2 * (INT16_MAX - 1)) if upper > lower else 1.0
+        quantized = np.round((log_flow - offset) / scale)
+        quantized[np.isnan(quantized)] = INT16_FILL
+        encoded = data.copy(data=quantized.astype(np.int16))
+        encoded.coords["log_scale"] = scale
+        encoded.coords["log_offset"] = offset
+        return encoded
+    elif storage == "exceedance":
+        thresholds = parse_thresholds(thresholds)
+        if len(thresholds) == 0:
+            raise ValueError("Exceedance storage needs at least one threshold")
+        axis = data.dims.index("simulation")
+        packed = np.stack(
+            [
+                np.packbits(data.values > threshold, axis=axis)
+                for threshold in thresholds
+            ]
+        )
+        dims = ["threshold"] + [
+            "packed_simulation" if dim == "simulation" else dim for dim in data.dims
+        ]
+        coords = {dim: data[dim] for dim in data.dims if dim != "simulation"}
+        coords.update(
+            {"threshold": thresholds, "n_simulation": data["simulation"].size}
+        )
+        return xr.DataArray(data=packed, coords=coords, dims=dims, name=data.name)
+    else:
+        raise ValueError("Invalid storage: {} not recognized".format(storage))
+
+
+def exceedance_fraction(data: xr.DataArray, threshold: float) -> xr.DataArray:
+    """Fraction of simulations which exceed the threshold
+
+    Parameters
+    ----------
+    data : the projection, in any of the `STORAGE` representations
+    threshold : what constitutes a flood
+    """
+    storage = get_storage(data)
+    if storage == "exceedance":
+        if threshold not in data["threshold"].values:
+            raise ValueError(
+                "Threshold {} was not saved, only {}".format(
+                    threshold, data["threshold"].values
+                )
+            )
+        packed = data.sel(threshold=threshold, drop=True)
+        n_exceed = xr.apply_ufunc(
+            lambda bits: _POPCOUNT[bits].sum(axis=-1),
+            packed,
+            input_core_dims=[["packed_simulation"]],
+            dask="parallelized",
+            output_dtypes=[np.uint16],
+        )
+        return (n_exceed / data["n_simulation"]).drop_vars("n_simulation")
+    elif storage == "lognormal":
+        return lognormal_exceedance(
+            data.sel(moment="mu", drop=True),
+            data.sel(moment="sigma", drop=True),
+            threshold=threshold,
+        ).mean(dim="simulation")
+    elif storage == "int16":
+        cutoff = (np.log(threshold) - data["log_offset"]) / data["log_scale"]
+        exceed = (data > cutoff) & (data != INT16_FILL)
+        exceed = exceed.drop_vars(["log_scale", "log_offset"])
+        return exceed.mean(dim="simulation")
+    else:
+        return (data > threshold).mean(dim="simulation")
+
+
+def lognormal_exceedance(
+    log_mu: xr.DataArray, log_sigma: xr.DataArray, threshold: float
+) -> xr.DataArray:
+    """Probability that a log-normal variable exceeds the threshold
+
+    Missing parameters (failed fits) count as not exceeding, as they do
+    when flows are compared with the threshold.
+
+    Parameters
+    ----------
+    log_mu : the mean of the log-flow
+    log_sigma : the standard deviation of the log-flow
+    threshold : what constitutes a flood
+    """
+    z_score = (log_mu - np.log(threshold)) / log_sigma
+    return xr.apply_ufunc(ndtr, z_score, dask="allowed").fillna(0)
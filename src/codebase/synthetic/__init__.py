@@ -1,3 +1,4 @@
 from .synthetic import SyntheticFloodSequence
 from .markov import MarkovTwoStateChain
 from .nino3 import NINO3Linear
+from .scenarios import Scenarios
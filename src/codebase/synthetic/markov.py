@@ -1,8 +1,8 @@
 """Generate sequences from a two-state Markov chain
 """
 
+from typing import Tuple
 import numpy as np
-import pomegranate as pm
 
 from .synthetic import SyntheticFloodSequence
 
@@ -26,39 +26,36 @@ class MarkovTwoStateChain(SyntheticFloodSequence):
         self.param.update(model_param)
         self.model_name = "Two-State Markov Chain"
 
-    def _calculate_one(self) -> np.ndarray:
-        """Run the calculation
+    def _get_moments(
+        self, rng=np.random, seq: int = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Get the mean and standard deviation of the log-flow of each year
         """
 
-        # Get the sequence of states
-        dist_1 = pm.DiscreteDistribution(
-            {"wet": 0.5, "dry": 0.5}
-        )  # random starting point
-        dist_2 = pm.ConditionalProbabilityTable(
-            [
-                ["wet", "wet", self.param["pi_1"]],
-                ["wet", "dry", 1 - self.param["pi_1"]],
-                ["dry", "wet", 1 - self.param["pi_2"]],
-                ["dry", "dry", self.param["pi_2"]],
-            ],
-            [dist_1],
-        )
-        markov_chain = pm.MarkovChain([dist_1, dist_2])
+        # Get the conditional expected value in each state; with swept
+        # parameters these are [scenario, year]
         years = self._get_time("all")
-        states = markov_chain.sample(years.size)
-
-        # Get the conditional expected value
-        mu_1_vec = self.param["mu_1"] + self.param["gamma_1"] * years
-        mu_2_vec = self.param["mu_2"] + self.param["gamma_2"] * years
-        mu_vec = mu_1_vec
-        mu_vec[np.where(np.array(states) == "wet")] = mu_2_vec[
-            np.where(np.array(states) == "wet")
-        ]
+        mu_1_vec = self._get_param("mu_1") + self._get_param("gamma_1") * years
+        mu_2_vec = self._get_param("mu_2") + self._get_param("gamma_2") * years
+        shape = np.broadcast(
+            mu_1_vec, mu_2_vec, self._get_param("pi_1"), self._get_param("pi_2")
+        ).shape
+
+        # Get the sequence of states, from a random starting point; a wet
+        # year stays wet with probability pi_1 and a dry year dry with pi_2
+        stay_wet = np.broadcast_to(self._get_param("pi_1"), shape)[..., 0]
+        leave_dry = 1 - np.broadcast_to(self._get_param("pi_2"), shape)[..., 0]
+        uniform = self._draw_years(rng, seq=seq, stream="uniform")
+        wet = np.empty(shape, dtype=bool)
+        wet[..., 0] = uniform[0] < 0.5
+        for t in range(1, years.size):
+            p_wet = np.where(wet[..., t - 1], stay_wet, leave_dry)
+            wet[..., t] = uniform[t] < p_wet
+        mu_vec = np.where(wet, mu_2_vec, mu_1_vec)
 
         # get conditional variance
-        sigma_vec = self.param["coeff_var"] * mu_vec
-        sigma_vec[sigma_vec < self.param["sigma_min"]] = self.param["sigma_min"]
+        sigma_vec = np.maximum(
+            self._get_param("coeff_var") * mu_vec, self._get_param("sigma_min")
+        )
 
-        # get and the streamflow
-        sflow = np.exp(np.random.normal(loc=mu_vec, scale=sigma_vec))
-        return sflow
+        return mu_vec, sigma_vec
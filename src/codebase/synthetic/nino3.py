@@ -1,7 +1,17 @@
 """Generate synthetic streamflow sequences based on a NINO3 sequence
+
+Each sequence follows a window of N + M years of the 20,000-year NINO3
+record, picked at random. With `sampling="stratified"`, the windows are
+first split into strata of equal probability by their mean and by the
+share of their variance in the ENSO band, and every stratum gets its share
+of the sequences (at least one). Each sequence carries the `stratum` it was
+drawn from and a `weight` (its stratum's share of the windows over its
+share of the sequences), which fitters use to keep their estimates unbiased.
 """
 
+from functools import lru_cache
 import os
+from typing import Tuple
 import numpy as np
 import pandas as pd
 import xarray as xr
@@ -11,6 +21,93 @@ from .synthetic import SyntheticFloodSequence
 from ..path import data_path
 
 
+SAMPLING = ["uniform", "stratified"]
+ENSO_BAND = (2, 7)  # the periods of the ENSO band, in years
+
+
+@lru_cache(maxsize=1)
+def read_nino3() -> pd.DataFrame:
+    """Read the NINO3 data once per process
+    """
+    filename = os.path.join(data_path, "ramesh2017.csv")
+    return pd.read_csv(filename, index_col="year")
+
+
+@lru_cache(maxsize=8)
+def get_window_index(length: int) -> pd.DataFrame:
+    """Summarize every window of the NINO3 record which a sequence can follow
+
+    Returns the `mean` and `band_energy` (the share of the variance in the
+    ENSO band) of the window starting in each valid year, which
+    `get_strata` bins.
+
+    Parameters
+    ----------
+    length : the length of the windows, N + M
+    """
+    nino3 = read_nino3()["nino3"]
+    starts = np.arange(nino3.index.max() - length)
+    first = nino3.index.get_indexer(starts)
+    windows = nino3.values[first[:, np.newaxis] + np.arange(length)]
+    anomalies = windows - windows.mean(axis=1, keepdims=True)
+    power = np.abs(np.fft.rfft(anomalies, axis=1)[:, 1:]) ** 2
+    frequency = np.fft.rfftfreq(length)[1:]
+    in_band = (frequency >= 1 / ENSO_BAND[1]) & (frequency <= 1 / ENSO_BAND[0])
+    return pd.DataFrame(
+        {
+            "mean": windows.mean(axis=1),
+            "band_energy": power[:, in_band].sum(axis=1) / power.sum(axis=1),
+        },
+        index=pd.Index(starts, name="year"),
+    )
+
+
+@lru_cache(maxsize=8)
+def get_strata(length: int, n_bins: int) -> np.ndarray:
+    """Label each window of `get_window_index` with its stratum
+
+    The strata cross `n_bins` bins of equal probability of the mean with
+    `n_bins` of the band energy.
+    """
+    index = get_window_index(length)
+    bins = [
+        (index[name].rank(method="first").values - 1) * n_bins // len(index)
+        for name in ["mean", "band_energy"]
+    ]
+    return (bins[0] * n_bins + bins[1]).astype(int)
+
+
+@lru_cache(maxsize=8)
+def get_design(length: int, n_bins: int, n_seq: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Share the sequences between the strata
+
+    Every stratum gets one sequence, and the rest are shared in proportion
+    to the number of windows of each stratum. The sequences of the strata
+    are interleaved, so that the first sequences cover them evenly too.
+
+    Returns the stratum and the weight of each sequence.
+    """
+    strata = get_strata(length, n_bins)
+    labels, n_windows = np.unique(strata, return_counts=True)
+    if n_seq < labels.size:
+        raise ValueError(
+            "{} strata need at least as many sequences, not {}".format(
+                labels.size, n_seq
+            )
+        )
+    quota = (n_seq - labels.size) * n_windows / n_windows.sum()
+    n_draws = 1 + np.floor(quota).astype(int)
+    remainder = n_seq - n_draws.sum()
+    n_draws[np.argsort(np.floor(quota) - quota, kind="stable")[:remainder]] += 1
+
+    # place the draws of each stratum evenly along the sequences
+    stratum = np.repeat(labels, n_draws)
+    position = np.concatenate([(0.5 + np.arange(n)) / n for n in n_draws])
+    order = np.argsort(position, kind="stable")
+    weight = (n_windows / n_windows.sum()) / (n_draws / n_seq)
+    return stratum[order], np.repeat(weight, n_draws)[order]
+
+
 class NINO3Linear(SyntheticFloodSequence):
     """Draw streamflow sequences based on a linear relationship with a NINO3 index/
     NINO3 data from Ramesh et al (2017)
@@ -24,29 +121,56 @@ class NINO3Linear(SyntheticFloodSequence):
             "coeff_var": kwargs.pop("coeff_var", 0.1),
             "sigma_min": kwargs.pop("sigma_min", 0.01),
         }
+        sampling = kwargs.pop("sampling", "uniform")
+        if sampling not in SAMPLING:
+            raise ValueError("Invalid sampling: {} not recognized".format(sampling))
+        strata = kwargs.pop("strata", 4)
         super().__init__(**kwargs)
         self.param.update(model_param)
+        self._set_option("sampling", sampling, default="uniform")
+        if sampling == "stratified":
+            self._set_option("strata", int(strata), default=4)
         self.model_name = "NINO3"
 
-    def _calculate_one(self) -> np.ndarray:
-        """Run the calculation
+    def _get_design(self) -> dict:
+        """Get the stratum and weight of each sequence, if they're stratified
+        """
+        if self.options["sampling"] != "stratified":
+            return {}
+        stratum, weight = get_design(
+            self.M + self.N, self.options["strata"], self.param.get("n_seq")
+        )
+        return {"stratum": stratum, "weight": weight}
+
+    def shares_history(self) -> bool:
+        """Seeded windows are drawn from the valid ones for N and M, so their
+        history changes with M
+        """
+        return not self.is_virtual()
+
+    def _get_moments(
+        self, rng=np.random, seq: int = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Get the mean and standard deviation of the log-flow of each year
         """
-        np.random.seed(datetime.now().microsecond)
-        filename = os.path.join(data_path, "ramesh2017.csv")
-        nino3 = pd.read_csv(filename, index_col="year")
+        if rng is np.random:
+            np.random.seed(datetime.now().microsecond)
+        nino3 = read_nino3()
         valid_start_years = np.arange(nino3.index.max() - (self.M + self.N))
-        syear = np.random.choice(valid_start_years)
+        if self.options["sampling"] == "stratified":
+            stratum = self._get_design()["stratum"][seq - 1]
+            strata = get_strata(self.M + self.N, self.options["strata"])
+            valid_start_years = valid_start_years[strata == stratum]
+        syear = rng.choice(valid_start_years)
         eyear = syear + self.N + self.M - 1
         nino3_sub = nino3.loc[syear:eyear]["nino3"].values
 
         mu = (
-            self.param.get("mu0")
-            + self.param.get("gamma") * self._get_time(period="all")
-            + self.param.get("beta") * nino3_sub
+            self._get_param("mu0")
+            + self._get_param("gamma") * self._get_time(period="all")
+            + self._get_param("beta") * nino3_sub
         )
-        sigma = self.param.get("coeff_var") * mu
-        sigma[np.where(sigma < self.param.get("sigma_min"))] = self.param.get(
-            "sigma_min"
+        sigma = np.maximum(
+            self._get_param("coeff_var") * mu, self._get_param("sigma_min")
         )
-        sflow = np.exp(np.random.normal(loc=mu, scale=sigma))
-        return sflow
+        return mu, sigma
@@ -0,0 +1,150 @@
+"""Draw one generator under many settings of its parameters at once
+
+A sensitivity sweep over `beta` or `pi_1` used to need one generator per
+value, each drawn on its own. `Scenarios` still makes one generator per
+setting (so each is cached, fit and evaluated like any other), but draws
+the ones which aren't cached yet together: the swept parameters become
+arrays, and each sequence is drawn once for every scenario, from the same
+random numbers. A seeded scenario gets exactly the sequences it would get
+on its own.
+"""
+
+from collections import OrderedDict
+from typing import List
+import copy
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from ..instrument import recorder
+from .synthetic import SyntheticFloodSequence
+
+
+class Scenarios:
+    """A generator under several settings of its parameters
+    """
+
+    def __init__(self, generator_class, scenarios, **kwargs) -> None:
+        """Make a generator for each scenario
+
+        Parameters
+        ----------
+        generator_class : the class of the generators, e.g. `NINO3Linear`
+        scenarios : the values of the swept parameters, one row per scenario,
+            as a data frame or a dict of lists (e.g. from `expand_grid`)
+        kwargs : the other parameters, shared by every scenario
+        """
+        self.scenarios = pd.DataFrame(scenarios).reset_index(drop=True)
+        self.generators: List[SyntheticFloodSequence] = []
+        for values in self.scenarios.to_dict("records"):
+            generator = generator_class(**kwargs, **values)
+            generator.scenario = OrderedDict(
+                (name, values[name]) for name in self.scenarios.columns
+            )
+            self.generators.append(generator)
+        first = self.generators[0]
+        for name in self.scenarios.columns:
+            if name not in first.param or name in first.options or name == "n_seq":
+                raise ValueError("Can't sweep {}: not a model parameter".format(name))
+        self.data = None
+
+    def _draw(self, generators: list) -> List[xr.DataArray]:
+        """Draw every sequence of several scenarios at once
+        """
+        swept = copy.copy(generators[0])
+        swept.param = dict(swept.param)
+        for name in self.scenarios.columns:
+            swept.param[name] = np.array([gen.param[name] for gen in generators])
+
+        sequences = 1 + np.arange(swept.param.get("n_seq"))
+        draws = []
+        for seq in sequences:
+            flow, mu, sigma = swept._draw_one(rng=swept._get_rng(seq), seq=seq)
+            shape = (len(generators), flow.shape[-1])
+            draws.append([np.broadcast_to(val, shape) for val in (flow, mu, sigma)])
+        flow, mu, sigma = [np.stack(draw, axis=1) for draw in zip(*draws)]
+
+        blocks = []
+        for i, generator in enumerate(generators):
+            block = generator._label_block(
+                sequences, flow=flow[i], mu=mu[i], sigma=sigma[i]
+            )
+            for name, values in generator._get_design().items():
+                block.coords[name] = ("sequence", values)
+            block.attrs = generator._get_attributes()
+            blocks.append(block)
+        return blocks
+
+    def get_data(self, io=None) -> xr.DataArray:
+        """Get the data of every scenario, indexed [scenario, sequence, year]
+
+        Cached scenarios are read, and the others are drawn together and then
+        cached one by one. Virtual (seeded, cheap) generators draw their own
+        sequences on demand, as usual.
+
+        Parameters
+        ----------
+        io : a `BackgroundIO` to read and write the cache through (optional)
+        """
+        missing = []
+        for generator in self.generators:
+            if generator.is_virtual():
+                generator.get_data()
+                continue
+            data, success = generator._read_cache(io=io)
+            if success:
+                generator.data = data
+            else:
+                missing.append(generator)
+
+        if missing:
+            with recorder.timer("_calculate_all", **missing[0]._get_tags()):
+                blocks = self._draw(missing)
+            for generator, data in zip(missing, blocks):
+                generator.data = data
+                generator._write_cache(data=data, io=io)
+
+        self.data = xr.concat(
+            [generator.data for generator in self.generators], dim="scenario"
+        )
+        self.data["scenario"] = np.arange(len(self.generators))
+        for name in self.scenarios.columns:
+            self.data.coords[name] = ("scenario", self.scenarios[name].values)
+        return self.data
+
+    def evaluate(
+        self,
+        fitter_class,
+        threshold: float,
+        io=None,
+        n_boot: int = 0,
+        ci_level: float = 0.95,
+        **kwargs
+    ):
+        """Fit every scenario with the same statistical model and evaluate it
+
+        Returns a row per scenario, with the swept parameters as columns.
+
+        Parameters
+        ----------
+        fitter_class : the class of the fitters, e.g. `LN2Stationary`
+        threshold : what constitutes a flood
+        io : a `BackgroundIO` to read and write the cache through (optional)
+        n_boot : how many bootstrap resamples give the confidence intervals
+            of each scenario (none if 0)
+        ci_level : the level of the confidence intervals
+        kwargs : the parameters of the fitters
+        """
+        if self.data is None:
+            self.get_data(io=io)
+        results = []
+        for values, generator in zip(
+            self.scenarios.to_dict("records"), self.generators
+        ):
+            fitter = fitter_class(synthetic=generator, **kwargs)
+            fitter.get_data(io=io)
+            result = fitter.evaluate(
+                threshold=threshold, n_boot=n_boot, ci_level=ci_level
+            )
+            results.append(result.assign(**values))
+        return pd.concat(results)
@@ -1,49 +1,321 @@
+from collections import OrderedDict
 from hashlib import md5
 import os
+import threading
+import dask
+import dask.array as dsa
 import xarray as xr
 import numpy as np
 import matplotlib.pyplot as plt
 from typing import Tuple
 
-from ..path import cache_path
 from ..core import BaseSequence
+from ..instrument import recorder
+from ..plotting import fan_chart
+
+FIRST_YEAR, LAST_YEAR = -999, 1000  # the years a seeded sequence has draws for
+STREAMS = ["normal", "uniform"]
 
 
 class SyntheticFloodSequence(BaseSequence):
     """A base class for generating synthetic sequences of streamflow
+
+    With a `seed`, each sequence is drawn from its own random state, seeded
+    by (seed, sequence), so any sequence can be drawn again exactly. Its
+    yearly draws are keyed by (seed, sequence, year), so a year's flow
+    doesn't change with M or N; the years run from FIRST_YEAR to LAST_YEAR,
+    so seeded generators take N and M of at most 1000. Cheap
+    generators are then "virtual": nothing is written to file, and `data`
+    is a lazy (dask) array whose blocks of sequences are drawn when they're
+    used, keeping the last few in memory.
+
+    Model parameters may also be arrays, one value per scenario, so that
+    `Scenarios` (see `sweep`) can draw several settings at once.
     """
 
+    expensive = False  # whether seeded sequences are worth caching to file
+
     def __init__(self, **kwargs) -> None:
+        """Generate synthetic sequences
+
+        Parameters
+        ----------
+        n_seq : how many sequences to generate
+        moments : if 1, also keep the mean and standard deviation of the
+            log-flow of each year as coordinates `log_mu` and `log_sigma`, so
+            that exceedance probabilities can be computed exactly
+        seed : if given, seed the random state of each sequence
+        block_size : how many sequences a block of virtual data holds
+        cache_blocks : how many blocks of virtual data to keep in memory
+        """
         seq_param = {"n_seq": kwargs.pop("n_seq")}
+        moments = kwargs.pop("moments", 0)
+        seed = kwargs.pop("seed", None)
+        self.block_size = kwargs.pop("block_size", 100)
+        self.cache_blocks = kwargs.pop("cache_blocks", 8)
         super().__init__(category="SyntheticFloodSequence", **kwargs)
         self.param.update(seq_param)
+        self._set_option("moments", int(moments), default=0)
+        self._set_option("seed", seed, default=None)
+        self._blocks: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()  # dask may draw blocks in several threads
+        self.scenario: OrderedDict = OrderedDict()  # swept parameters, if any
         self.model_name = ""
 
-    def _calculate_one(self) -> np.ndarray:
+    @classmethod
+    def sweep(cls, scenarios, **kwargs):
+        """Get the `Scenarios` of this generator under several settings
+
+        Parameters
+        ----------
+        scenarios : the values of the swept parameters, one row per scenario
+        kwargs : the other parameters, shared by every scenario
+        """
+        from .scenarios import Scenarios
+
+        return Scenarios(cls, scenarios=scenarios, **kwargs)
+
+    def _get_param(self, name: str):
+        """Get a model parameter, as a column [scenario, 1] if it is swept
+        """
+        value = self.param[name]
+        if np.ndim(value) == 0:
+            return value
+        return np.asarray(value)[:, np.newaxis]
+
+    def _get_moments(
+        self, rng=np.random, seq: int = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
         """This *must* be implemented by a specific child class
+        Should return the mean and standard deviation of the log-flow of
+        each year of a single sequence
+
+        Parameters
+        ----------
+        rng : the random state to draw from
+        seq : the label of the sequence
         """
         raise NotImplementedError
 
+    def get_scenario_label(self) -> str:
+        """Get a label for the swept parameters, e.g. 'beta=0.5, gamma=0'
+        """
+        return ", ".join(
+            "{}={}".format(name, value) for name, value in self.scenario.items()
+        )
+
+    def _get_design(self) -> dict:
+        """Get coordinates along `sequence` which describe how the sequences
+        were sampled, e.g. their `weight` (none by default)
+        """
+        return {}
+
+    def shares_history(self) -> bool:
+        """Whether the historical years of each sequence stay the same when
+        only M changes, so that fits can be shared between such cells
+        """
+        return True
+
+    def _draw_years(self, rng, seq: int, stream: str) -> np.ndarray:
+        """Draw a standard normal or uniform number for each year
+
+        A seeded sequence draws every year from FIRST_YEAR to LAST_YEAR from
+        its own stream, as `codebase.crn` does, and keeps the years it needs.
+
+        Parameters
+        ----------
+        rng : the random state of the sequence
+        seq : the label of the sequence
+        stream : 'normal' or 'uniform'
+        """
+        years = self._get_time("all")
+        if self.options["seed"] is None:
+            if stream == "normal":
+                return rng.standard_normal(size=years.size)
+            return rng.uniform(size=years.size)
+        if years[0] < FIRST_YEAR or years[-1] > LAST_YEAR:
+            raise ValueError(
+                "Seeded sequences span years {} to {}".format(FIRST_YEAR, LAST_YEAR)
+            )
+        stream_rng = np.random.RandomState(
+            [self.options["seed"], seq, 1 + STREAMS.index(stream)]
+        )
+        n_years = LAST_YEAR - FIRST_YEAR + 1
+        if stream == "normal":
+            draws = stream_rng.standard_normal(size=n_years)
+        else:
+            draws = stream_rng.uniform(size=n_years)
+        return draws[years - FIRST_YEAR]
+
+    def _get_rng(self, seq: int):
+        """Get the random state of a sequence
+        """
+        if self.options["seed"] is None:
+            return np.random
+        return np.random.RandomState([self.options["seed"], seq])
+
+    def is_virtual(self) -> bool:
+        """Whether the data are drawn on demand rather than cached to file
+        """
+        return self.options["seed"] is not None and not self.expensive
+
+    def _draw_one(
+        self, rng=np.random, seq: int = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Draw a single sequence of log-normal flows, with its moments
+
+        Swept parameters give moments [scenario, year], and every scenario
+        shares the same random numbers.
+        """
+        mu, sigma = self._get_moments(rng=rng, seq=seq)
+        innovation = self._draw_years(rng, seq=seq, stream="normal")
+        return np.exp(mu + sigma * innovation), mu, sigma
+
+    def _calculate_one(self, rng=np.random, seq: int = None) -> xr.DataArray:
+        """Draw a single sequence of log-normal flows
+
+        Parameters
+        ----------
+        rng : the random state to draw from
+        seq : the label of the sequence
+        """
+        flow, mu, sigma = self._draw_one(rng=rng, seq=seq)
+        sflow = xr.DataArray(
+            data=flow,
+            coords={"year": self._get_time("all")},
+            dims="year",
+            name="Synthetic Streamflow Sequence",
+        )
+        if self.options["moments"]:
+            sflow.coords["log_mu"] = ("year", mu)
+            sflow.coords["log_sigma"] = ("year", sigma)
+        return sflow
+
     def _calculate_all(self) -> xr.DataArray:
         """Just loop through and combine
         """
         sequences = 1 + np.arange(self.param.get("n_seq"))
+        calculate_one = recorder.timed(
+            self._calculate_one, "_calculate_one", **self._get_tags()
+        )
         sflow = xr.concat(
-            [
-                xr.DataArray(
-                    data=self._calculate_one(),
-                    coords={"year": self._get_time("all")},
-                    dims="year",
-                    name="Synthetic Streamflow Sequence",
-                )
-                for seq in sequences
-            ],
+            [calculate_one(rng=self._get_rng(seq), seq=seq) for seq in sequences],
             dim="sequence",
         )
         sflow["sequence"] = sequences
+        for name, values in self._get_design().items():
+            sflow.coords[name] = ("sequence", values)
         sflow.attrs = self._get_attributes()
         return sflow
 
+    def get_block(self, sequences) -> xr.DataArray:
+        """Draw some of the (seeded) sequences, or get them from memory
+
+        Parameters
+        ----------
+        sequences : the labels of the sequences
+        """
+        key = tuple(int(seq) for seq in np.atleast_1d(sequences))
+        with self._lock:
+            if key in self._blocks:
+                self._blocks.move_to_end(key)
+                return self._blocks[key]
+        flow, mu, sigma = [
+            np.stack(draws)
+            for draws in zip(
+                *[self._draw_one(rng=self._get_rng(seq), seq=seq) for seq in key]
+            )
+        ]
+        block = self._label_block(list(key), flow=flow, mu=mu, sigma=sigma)
+        with self._lock:
+            self._blocks[key] = block
+            while len(self._blocks) > self.cache_blocks:
+                self._blocks.popitem(last=False)
+        return block
+
+    def _label_block(self, sequences, flow, mu, sigma) -> xr.DataArray:
+        """Label the flows [sequence, year] of some sequences, and their moments
+        """
+        block = xr.DataArray(
+            data=flow,
+            coords={"sequence": sequences, "year": self._get_time("all")},
+            dims=["sequence", "year"],
+            name="Synthetic Streamflow Sequence",
+        )
+        if self.options["moments"]:
+            block.coords["log_mu"] = (["sequence", "year"], mu)
+            block.coords["log_sigma"] = (["sequence", "year"], sigma)
+        return block
+
+    def _get_block_values(self, sequences, name: str) -> np.ndarray:
+        """The flows (or one of the moments) of a block, as a numpy array
+        """
+        block = self.get_block(sequences)
+        return block.values if name == "flow" else block[name].values
+
+    def _get_virtual(self) -> xr.DataArray:
+        """Get all the sequences as a lazy array, a block of sequences per chunk
+        """
+        sequences = 1 + np.arange(self.param.get("n_seq"))
+        years = self._get_time("all")
+        blocks = [
+            sequences[start : start + self.block_size]
+            for start in range(0, sequences.size, self.block_size)
+        ]
+        token = dask.base.tokenize(dict(self._get_attributes()))
+
+        def lazy(name):
+            return dsa.concatenate(
+                [
+                    dsa.from_delayed(
+                        dask.delayed(self._get_block_values)(
+                            block,
+                            name=name,
+                            dask_key_name="{}-{}-{}".format(token, name, block[0]),
+                        ),
+                        shape=(block.size, years.size),
+                        dtype=float,
+                    )
+                    for block in blocks
+                ]
+            )
+
+        sflow = xr.DataArray(
+            data=lazy("flow"),
+            coords={"sequence": sequences, "year": years},
+            dims=["sequence", "year"],
+            name="Synthetic Streamflow Sequence",
+            attrs=self._get_attributes(),
+        )
+        if self.options["moments"]:
+            sflow.coords["log_mu"] = (["sequence", "year"], lazy("log_mu"))
+            sflow.coords["log_sigma"] = (["sequence", "year"], lazy("log_sigma"))
+        for name, values in self._get_design().items():
+            sflow.coords[name] = ("sequence", values)
+        return sflow
+
+    def get_data(self, io=None) -> xr.DataArray:
+        """Get the data, lazily if the generator is virtual
+
+        Parameters
+        ----------
+        io : a `BackgroundIO` to read and write the cache through (optional)
+        """
+        if not self.is_virtual():
+            return super().get_data(io=io)
+        self.data = self._get_virtual()
+        return self.data
+
+    def __getstate__(self) -> dict:
+        state = super().__getstate__()
+        state["_blocks"] = OrderedDict()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
     def _get_filename(self) -> str:
         """Get a file name
 
@@ -63,7 +335,7 @@ class SyntheticFloodSequence(BaseSequence):
         file_string = md5(file_string.encode("ascii")).hexdigest()
         file_string += ".nc"
 
-        file_dir = os.path.join(cache_path, self.category)
+        file_dir = os.path.join(self.cache_dir, self.category)
         file_dir = os.path.abspath(file_dir)
         if not os.path.isdir(file_dir):
             os.makedirs(file_dir)
@@ -103,17 +375,32 @@ class SyntheticFloodSequence(BaseSequence):
 
     def lineplot(self, **kwargs) -> None:
         """Create a line plot of simulated sequences
+
+        With `mode="lines"` (the default) every sequence is drawn, as a single
+        line collection. With `mode="fan"` the quantiles of each year are
+        drawn as bands instead (see `codebase.plotting.fan_chart`, which takes
+        the other keyword arguments), which suits many sequences better.
         """
         sequences = self.data
         sequences = sequences.sel(year=self._get_time(kwargs.pop("period", "all")))
+        sequences = sequences.load()  # draw (or read) them just once
+        mode = kwargs.pop("mode", "lines")
+        color = kwargs.pop("c", "blue")
         fig, ax = plt.subplots(figsize=(10, 5), nrows=1, ncols=1)
-        for s in np.arange(self.param.get("n_seq")):
-            sequences.sel(sequence=(s + 1)).plot(
-                ax=ax,
-                c=kwargs.pop("c", "blue"),
+        if mode == "lines":
+            fan_chart(
+                ax,
+                sequences,
+                quantiles=[],
+                n_lines=sequences["sequence"].size,
+                color=color,
                 linewidth=kwargs.pop("linewidth", 0.25),
             )
-            ax.set_ylim([sequences.min(), sequences.max()])
-            ax.semilogy()
-            ax.set_title(self.model_name)
+        elif mode == "fan":
+            fan_chart(ax, sequences, color=color, **kwargs)
+        else:
+            raise ValueError("Invalid mode: {} not recognized".format(mode))
+        ax.set_ylim([sequences.min().values, sequences.max().values])
+        ax.semilogy()
+        ax.set_title(self.model_name)
         fig.tight_layout()
@@ -0,0 +1,429 @@
+"""A queue of tasks shared by any number of workers, in an SQLite file
+
+Splitting `param_df` between workers up front leaves the fast ones idle
+while one grinds through the slowest cells. Instead, every worker (on one
+machine or across SLURM nodes) runs `run_worker` on the same `param_df`
+and pulls tasks from a queue on the shared `cache_path` until none are left:
+
+* `generate` the data of a generator once, so that every chunk of a cell
+  fits the same sequences;
+* `fit` a chunk of the sequences of a cell, to a chunk file;
+* `merge` the chunks of a cell into its cache file, once they are all fit.
+
+Tasks are claimed in a transaction, so no two workers claim the same one.
+A worker updates the heartbeat of its task every so often; a task whose
+heartbeat is older than `heartbeat_timeout` (because its worker crashed or
+was killed) goes back in the queue. Heartbeats compare wall clock times, so
+nodes sharing a queue need synchronized clocks. No broker is needed, only a
+file system with working locks (most NFS mounts have them, but not all).
+
+Once the queue is drained, `run_experiment` reads every cell from the cache.
+"""
+
+from contextlib import contextmanager
+from hashlib import md5
+from typing import Dict, List, NamedTuple
+import copy
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import numpy as np
+import xarray as xr
+
+from .instrument import recorder
+from .path import cache_path
+from .progress import reporter
+
+logger = logging.getLogger(__name__)
+
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT UNIQUE NOT NULL,
+    kind TEXT NOT NULL,
+    cell INTEGER NOT NULL,
+    start INTEGER,
+    stop INTEGER,
+    after TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    heartbeat REAL,
+    attempts INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+# the first pending task whose generator is done, merges (of cells whose
+# chunks are all fit) first so that chunk files don't pile up
+CLAIMABLE = """
+SELECT name, kind, cell, start, stop FROM tasks AS task
+WHERE status = 'pending'
+AND (after IS NULL OR after IN (SELECT name FROM tasks WHERE status = 'done'))
+AND (kind != 'merge' OR NOT EXISTS (
+    SELECT 1 FROM tasks AS chunk
+    WHERE chunk.kind = 'fit' AND chunk.cell = task.cell AND chunk.status != 'done'
+))
+ORDER BY kind = 'merge' DESC, id
+LIMIT 1
+"""
+
+
+class Task(NamedTuple):
+    name: str
+    kind: str  # 'generate', 'fit' or 'merge'
+    cell: int  # the position of the cell in `param_df`
+    start: int  # the first sequence of a 'fit' task
+    stop: int  # the last sequence of a 'fit' task
+
+
+class TaskQueue:
+    """A queue of tasks in an SQLite file
+    """
+
+    def __init__(
+        self, filename: str, heartbeat_timeout: float = 600, max_attempts: int = 3
+    ) -> None:
+        """Open the queue, creating it if needed
+
+        Parameters
+        ----------
+        filename : the SQLite file, on a file system all the workers share
+        heartbeat_timeout : seconds without a heartbeat after which a running
+            task is given to another worker
+        max_attempts : how many times a task which raises an error, or whose
+            worker dies, is tried
+        """
+        self.filename = filename
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_attempts = max_attempts
+        self.worker = "{}-{}".format(socket.gethostname(), os.getpid())
+        with self._transaction() as conn:
+            conn.execute(SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        """Hold the write lock of the queue for the enclosed block
+        """
+        conn = sqlite3.connect(self.filename, timeout=60, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def add(self, tasks: List[Dict]) -> None:
+        """Add tasks, skipping any which are already in the queue
+
+        Parameters
+        ----------
+        tasks : the name, kind, cell, start, stop and after (the name of a
+            task which must be done first, or None) of each task
+        """
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO tasks (name, kind, cell, start, stop, after) "
+                "VALUES (:name, :kind, :cell, :start, :stop, :after)",
+                tasks,
+            )
+
+    def claim(self) -> Task:
+        """Claim the next task which can run, or None if there isn't one
+
+        Running tasks whose heartbeat has timed out (e.g. their worker was
+        killed for running out of memory or time) are requeued first, or
+        failed if they have been tried `max_attempts` times, like tasks which
+        raise an error.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            requeued = conn.execute(
+                "UPDATE tasks SET worker = NULL, status = CASE "
+                "WHEN attempts >= ? THEN ? ELSE ? END "
+                "WHERE status = ? AND heartbeat < ?",
+                (
+                    self.max_attempts,
+                    FAILED,
+                    PENDING,
+                    RUNNING,
+                    now - self.heartbeat_timeout,
+                ),
+            ).rowcount
+            if requeued > 0:
+                logger.warning("Took back %d task(s) with no heartbeat", requeued)
+            row = conn.execute(CLAIMABLE).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE tasks SET status = ?, worker = ?, heartbeat = ?, "
+                "attempts = attempts + 1 WHERE name = ?",
+                (RUNNING, self.worker, now, row[0]),
+            )
+        return Task(*row)
+
+    def heartbeat(self, task: Task) -> None:
+        """Tell the other workers this task is still running
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE tasks SET heartbeat = ? "
+                "WHERE name = ? AND worker = ? AND status = ?",
+                (time.time(), task.name, self.worker, RUNNING),
+            )
+
+    @contextmanager
+    def beating(self, task: Task):
+        """Send heartbeats for a task from a background thread, while the
+        enclosed block runs it
+        """
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.heartbeat_timeout / 4):
+                self.heartbeat(task)
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def complete(self, task: Task) -> None:
+        """Mark a task as done, unless it was given to another worker meanwhile
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE tasks SET status = ? WHERE name = ? AND worker = ?",
+                (DONE, task.name, self.worker),
+            )
+
+    def fail(self, task: Task) -> None:
+        """Requeue a task which raised an error, unless it has been tried
+        `max_attempts` times
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE tasks SET worker = NULL, status = CASE "
+                "WHEN attempts >= ? THEN ? ELSE ? END WHERE name = ? AND worker = ?",
+                (self.max_attempts, FAILED, PENDING, task.name, self.worker),
+            )
+
+    def get_chunks(self, cell: int) -> List[Task]:
+        """Get the 'fit' tasks of a cell, in order
+        """
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT name, kind, cell, start, stop FROM tasks "
+                "WHERE kind = 'fit' AND cell = ? ORDER BY start",
+                (cell,),
+            ).fetchall()
+        return [Task(*row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        """Get the number of tasks in each status
+        """
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT status, COUNT(*) FROM tasks GROUP BY status"
+            ).fetchall()
+        return dict(rows)
+
+
+def get_queue_file(param_df) -> str:
+    """Get a queue file name which identifies the cells of `param_df`
+    """
+    file_string = ""
+    for i, row in param_df.iterrows():
+        file_string += "_{}_{}".format(
+            row["generator"]._get_filename(), row["fitter"]._get_filename()
+        )
+    file_string = md5(file_string.encode("ascii")).hexdigest()
+    return os.path.join(cache_path, "queue-{}.sqlite".format(file_string))
+
+
+def get_generators(param_df) -> Dict:
+    """Get a generator for each generator file, long enough for every cell
+
+    Generators which differ only in M or N share a file, so the data of the
+    longest M and N are generated once and sliced for the other cells.
+    """
+    generators: Dict = {}
+    for i, row in param_df.iterrows():
+        generator = row["generator"]
+        if generator.is_virtual():
+            continue
+        filename = generator._get_filename()
+        if filename not in generators:
+            generators[filename] = copy.copy(generator)
+            generators[filename].param = dict(generator.param)  # not shared
+        longest = generators[filename]
+        longest.M = max(longest.M, generator.M)
+        longest.N = max(longest.N, generator.N)
+    return generators
+
+
+def get_tasks(param_df, chunk_size: int) -> List[Dict]:
+    """Get the tasks of the cells of `param_df` which aren't cached yet
+
+    Fitters which differ only in M share a file, so only the cell with the
+    longest M of each file is fit; the others read its projections.
+
+    Parameters
+    ----------
+    param_df : the generator and fitter of each cell
+    chunk_size : how many sequences each 'fit' task fits
+    """
+    fitters = list(param_df["fitter"])
+    longest: Dict = {}  # the cell with the longest M of each fitter file
+    for cell, fitter in enumerate(fitters):
+        filename = fitter._get_filename()
+        if filename not in longest or fitter.M > fitters[longest[filename]].M:
+            longest[filename] = cell
+
+    tasks = []
+    for cell, (i, row) in enumerate(param_df.iterrows()):
+        generator, fitter = row["generator"], row["fitter"]
+        if longest[fitter._get_filename()] != cell:
+            continue  # fit for another cell
+        data, cached = fitter._from_file()
+        if cached:
+            data.close()
+            continue  # cached by an earlier run
+        after = None
+        if not generator.is_virtual():
+            after = "generate:{}".format(generator._get_filename())
+            tasks.append(
+                dict(name=after, kind="generate", cell=cell, start=None, stop=None)
+            )
+        n_seq = fitter.param.get("n_seq")
+        for start in range(1, n_seq + 1, chunk_size):
+            tasks.append(
+                dict(
+                    name="fit:{}:{}".format(cell, start),
+                    kind="fit",
+                    cell=cell,
+                    start=start,
+                    stop=min(start + chunk_size - 1, n_seq),
+                    after=after,
+                )
+            )
+        tasks.append(
+            dict(name="merge:{}".format(cell), kind="merge", cell=cell, start=None)
+        )
+    for task in tasks:
+        task.setdefault("stop", None)
+        task.setdefault("after", None)
+    return tasks
+
+
+def get_chunk_file(fitter, task: Task) -> str:
+    """Get the file a 'fit' task writes its chunk of projections to
+    """
+    return "{}.cell-{}.seq-{}-{}.nc".format(
+        fitter._get_filename()[: -len(".nc")], task.cell, task.start, task.stop
+    )
+
+
+def _run_task(task: Task, queue: TaskQueue, param_df, generators: Dict) -> None:
+    """Run one task
+    """
+    if task.kind == "generate":
+        generators[task.name[len("generate:") :]].get_data()
+        return
+
+    fitter = param_df.iloc[task.cell]["fitter"]
+    tags = fitter._get_tags()
+    if task.kind == "fit":
+        sequences = np.arange(task.start, task.stop + 1)
+        reporter.start_cell(
+            model_name=fitter.model_name, M=fitter.M, N=fitter.N, n_seq=sequences.size
+        )
+        with recorder.timer("_calculate_batch", **tags):
+            fits = fitter._calculate_batch(sequences)
+        fitter._to_file(fits, filename=get_chunk_file(fitter, task))
+    elif task.kind == "merge":
+        data, cached = fitter._from_file()
+        if cached:
+            data.close()
+            return  # merged by a worker which had lost the task
+        chunks = queue.get_chunks(task.cell)
+        filenames = [get_chunk_file(fitter, chunk) for chunk in chunks]
+        chunks = []
+        with recorder.timer("_merge", **tags):
+            for filename in filenames:
+                with xr.open_dataarray(filename) as chunk:
+                    chunks.append(chunk.load())
+            data = xr.concat(chunks, dim="sequence")
+        fitter._write_cache(data=data)
+        for filename in filenames:
+            os.remove(filename)
+        reporter.end_cell()
+    else:
+        raise ValueError("Invalid task kind: {} not recognized".format(task.kind))
+
+
+def run_worker(
+    param_df,
+    queue_file=None,
+    chunk_size=100,
+    heartbeat_timeout=600,
+    max_attempts=3,
+    poll_interval=10,
+    status_file=None,
+):
+    """Fit the cells of `param_df` together with any other workers
+
+    Every worker must be given the same `param_df`, in the same order. The
+    first one to start fills the queue (later ones add nothing new), and each
+    then claims tasks until none are left to run. A worker which finds
+    nothing to claim while others are still running tasks waits
+    `poll_interval` seconds and tries again, since their tasks may be
+    requeued or may unlock the merge of a cell.
+
+    A task which raises an error is logged and requeued, and the worker moves
+    on to the next one. Returns the number of tasks in each status. Tasks
+    still failing after `max_attempts` tries are left 'failed', and the
+    merges of their cells 'pending'.
+    """
+    if queue_file is None:
+        queue_file = get_queue_file(param_df)
+    queue = TaskQueue(
+        queue_file, heartbeat_timeout=heartbeat_timeout, max_attempts=max_attempts
+    )
+    queue.add(get_tasks(param_df, chunk_size=chunk_size))
+    generators = get_generators(param_df)
+    reporter.start(status_file=status_file)
+
+    while True:
+        task = queue.claim()
+        if task is None:
+            if queue.counts().get(RUNNING, 0) == 0:
+                break
+            time.sleep(poll_interval)
+            continue
+        try:
+            with queue.beating(task):
+                _run_task(task, queue=queue, param_df=param_df, generators=generators)
+        except (KeyboardInterrupt, SystemExit):
+            queue.fail(task)
+            raise
+        except Exception:
+            logger.exception("Task %s failed", task.name)
+            queue.fail(task)
+            continue
+        queue.complete(task)
+
+    counts = queue.counts()
+    if counts.get(FAILED, 0) > 0:
+        logger.warning("%d task(s) failed, see %s", counts[FAILED], queue_file)
+    return counts
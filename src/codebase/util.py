@@ -4,14 +4,21 @@ These are broadly useful for the rest of the package
 """
 from typing import Any
 import itertools
+import logging
 import os
 import pickle
 import stat
 from hashlib import md5
 from pystan import StanModel
 import pandas as pd
+import xarray as xr
 
 from .path import data_path, cache_path
+from .backgroundio import BackgroundIO
+from .instrument import recorder
+from .progress import reporter
+
+logger = logging.getLogger(__name__)
 
 
 def compile_model(filename: str, model_name: str = "") -> StanModel:
@@ -85,34 +92,139 @@ def expand_grid(data_dict):
     return pd.DataFrame.from_records(rows, columns=data_dict.keys())
 
 
-def get_bias_variance(generator, fitter, threshold):
+def get_bias_variance(
+    generator,
+    fitter,
+    threshold,
+    tolerance=None,
+    batch_size=100,
+    io=None,
+    n_boot=0,
+    ci_level=0.95,
+    min_batches=2,
+):
     """Helpful for running experiments
+
+    If `tolerance` is given, only as many sequences are fit as are needed
+    for the standard errors of the bias and stdev to reach it, in at least
+    `min_batches` batches of `batch_size`. If `io` is
+    given, the cache is read and written through it. If `n_boot` is
+    positive, that many bootstrap resamples of the sequences give `ci_level`
+    confidence intervals.
     """
     N = generator.N
     M = generator.M
-    generator.get_data()
-    fitter.get_data()
-    df = fitter.evaluate(threshold=threshold)
+    generator.get_data(io=io)
+    if tolerance is None:
+        fitter.get_data(io=io)
+    else:
+        fitter.get_data_adaptive(
+            threshold=threshold,
+            tolerance=tolerance,
+            batch_size=batch_size,
+            min_batches=min_batches,
+            io=io,
+        )
+    df = fitter.evaluate(threshold=threshold, n_boot=n_boot, ci_level=ci_level)
     df["Generating_Function"] = generator.model_name
     df.drop(columns="Generating Function", inplace=True)
     df.rename(columns={"Fitting Function": "Fitting_Function"}, inplace=True)
     return df
 
 
-def run_experiment(param_df, n_seq, n_mcsim, threshold):
-    # Run through the parameters
-    result_list = [
-        get_bias_variance(
-            generator=row["generator"], fitter=row["fitter"], threshold=threshold
-        )
-        for i, row in param_df.iterrows()
-    ]
+def combine_results(result_list) -> xr.Dataset:
+    """Combine the results of `get_bias_variance` into a labeled data set
 
+    Results of generators from `Scenarios` are also indexed by `scenario`.
+    """
     results_df = pd.concat(result_list, axis=0)
     results_df.reset_index(inplace=True)
-    results_df.set_index(
-        ["M", "N", "Generating_Function", "Fitting_Function"], inplace=True
+    index = ["M", "N", "Generating_Function", "Fitting_Function"]
+    if "scenario" in results_df.columns:
+        results_df["scenario"] = results_df["scenario"].fillna("")
+        index.append("scenario")
+    results_df.set_index(index, inplace=True)
+    return results_df.to_xarray()
+
+
+def run_experiment(
+    param_df,
+    n_seq,
+    n_mcsim,
+    threshold,
+    timing_file=None,
+    status_file=None,
+    tolerance=None,
+    batch_size=100,
+    background_io=False,
+    max_pending_writes=2,
+    n_boot=0,
+    ci_level=0.95,
+    min_batches=2,
+):
+    """Evaluate every (generator, fitter) pair in `param_df`
+
+    A summary of the time spent in each stage, and of cache hits and bytes
+    read or written, is logged at the end and optionally saved to
+    `timing_file` as CSV. Progress and an ETA are logged as the run goes
+    and optionally appended to `status_file`.
+
+    With a `tolerance`, each cell stops fitting sequences once the standard
+    errors of its bias and stdev are below it (after at least `min_batches`
+    batches of `batch_size` sequences). The standard errors reached and the
+    number of sequences used are part of the results.
+
+    With `background_io`, cache files are written on a background thread
+    (with at most `max_pending_writes` queued) while the next cell starts,
+    and the generator data of the next cell are read ahead. Any write error
+    is raised by the end of the run, after the queued writes have finished.
+
+    With a positive `n_boot` (e.g. 1000), each cell also gets `ci_level`
+    bootstrap confidence intervals of its bias and stdev (`bias_lower`,
+    `bias_upper`, `stdev_lower` and `stdev_upper`) from `n_boot` resamples
+    of its sequences, without fitting anything again.
+
+    To share the cells between many workers, drain a queue with
+    `codebase.taskqueue.run_worker` first; this then reads them from the cache.
+    """
+    recorder.reset()
+    reporter.start(
+        plan=[(row["fitter"].model_name, n_seq) for i, row in param_df.iterrows()],
+        status_file=status_file,
     )
-    results_ds = results_df.to_xarray()
+
+    # Run through the parameters
+    io = BackgroundIO(max_pending=max_pending_writes) if background_io else None
+    rows = [row for i, row in param_df.iterrows()]
+    result_list = []
+    try:
+        for i, row in enumerate(rows):
+            if io is not None and i + 1 < len(rows):
+                if not rows[i + 1]["generator"].is_virtual():
+                    io.prefetch(rows[i + 1]["generator"])
+            result_list.append(
+                get_bias_variance(
+                    generator=row["generator"],
+                    fitter=row["fitter"],
+                    threshold=threshold,
+                    tolerance=tolerance,
+                    batch_size=batch_size,
+                    io=io,
+                    n_boot=n_boot,
+                    ci_level=ci_level,
+                    min_batches=min_batches,
+                )
+            )
+            reporter.end_cell()
+    finally:
+        if io is not None:
+            io.close()
+
+    results_ds = combine_results(result_list)
+
+    summary = recorder.summary()
+    logger.info("Time spent in each stage:\n%s", summary.to_string())
+    if timing_file is not None:
+        summary.to_csv(timing_file)
 
     return results_ds
@@ -0,0 +1,2 @@
+"""Regression tests for `codebase`, run with `python -m pytest` from `src`
+"""
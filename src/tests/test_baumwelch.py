@@ -0,0 +1,45 @@
+"""The vectorized Baum-Welch agrees with pomegranate
+"""
+
+import numpy as np
+import pytest
+
+from codebase.statfit.baumwelch import fit_gaussian_hmm
+
+
+def _two_state_sequence(length=400, seed=42) -> np.ndarray:
+    """A sequence of a two-state Gaussian HMM with persistent states
+    """
+    rng = np.random.RandomState(seed)
+    states = np.zeros(length, dtype=int)
+    for t in range(1, length):
+        states[t] = states[t - 1] if rng.uniform() < 0.9 else 1 - states[t - 1]
+    return rng.normal(np.array([0.0, 3.0])[states], np.array([0.5, 0.8])[states])
+
+
+def test_recovers_parameters():
+    X = _two_state_sequence()
+    fitted = fit_gaussian_hmm(X[np.newaxis], n_init=10, rng=np.random.RandomState(0))
+    assert np.allclose(fitted["means"][0], [0, 3], atol=0.15)
+    assert np.allclose(fitted["stds"][0], [0.5, 0.8], atol=0.15)
+    assert np.all(np.diag(fitted["trans"][0]) > 0.8)
+
+
+def test_matches_pomegranate():
+    pm = pytest.importorskip("pomegranate")
+    if not hasattr(pm, "HiddenMarkovModel"):
+        pytest.skip("needs the HiddenMarkovModel of pomegranate < 1.0")
+    X = _two_state_sequence()
+    fitted = fit_gaussian_hmm(X[np.newaxis], n_init=10, rng=np.random.RandomState(0))
+
+    np.random.seed(0)
+    model = pm.HiddenMarkovModel.from_samples(
+        pm.NormalDistribution, n_components=2, X=[X], n_init=10, pseudocount=10
+    )
+    expected = sorted(
+        state.distribution.parameters
+        for state in model.states
+        if state.distribution is not None
+    )
+    assert np.allclose(fitted["means"][0], [mean for mean, _ in expected], atol=0.05)
+    assert np.allclose(fitted["stds"][0], [std for _, std in expected], atol=0.05)
@@ -0,0 +1,83 @@
+"""Bootstrap confidence intervals cover the mean, including lone strata
+"""
+
+import numpy as np
+import xarray as xr
+
+from codebase.statfit import StatisticalModel
+from codebase.synthetic import NINO3Linear
+
+
+def _fitter(stratum: np.ndarray = None, weight: np.ndarray = None):
+    """A fitter of placeholder sequences, stratified if `stratum` is given
+    """
+    n_seq = 40 if stratum is None else stratum.size
+    generator = NINO3Linear(M=1, N=1, n_seq=n_seq, mu0=6)
+    generator.data = xr.DataArray(
+        np.zeros((n_seq, 1)),
+        coords={"sequence": 1 + np.arange(n_seq), "year": [1]},
+        dims=["sequence", "year"],
+    )
+    if stratum is not None:
+        generator.data.coords["stratum"] = ("sequence", stratum)
+        generator.data.coords["weight"] = ("sequence", weight)
+    return StatisticalModel(synthetic=generator, n_mcsim=1)
+
+
+def _stats(values: np.ndarray) -> xr.Dataset:
+    sequence = 1 + np.arange(values.size)
+    return xr.Dataset(
+        {"bias": ("sequence", values), "stdev": ("sequence", values ** 2)},
+        coords={"sequence": sequence},
+    )
+
+
+def _coverage(fitter, draw, truth, n_rep=200):
+    """The share of intervals covering `truth`, and their mean width over
+    that of the normal intervals from `_summarize`
+    """
+    covered, ratio = [], []
+    for rep in range(n_rep):
+        stats = _stats(draw(np.random.RandomState(rep)))
+        intervals = fitter._bootstrap(stats, n_boot=400, ci_level=0.95, seed=rep)
+        lower, upper = intervals["bias_lower"][0], intervals["bias_upper"][0]
+        std_error = fitter._summarize(stats)[1]["bias"].values
+        covered.append(lower <= truth <= upper)
+        ratio.append((upper - lower) / (2 * 1.96 * std_error))
+    return np.mean(covered), np.mean(ratio)
+
+
+def test_coverage():
+    fitter = _fitter()
+    coverage, ratio = _coverage(fitter, lambda rng: rng.normal(0.3, 1, 40), 0.3)
+    assert 0.88 <= coverage <= 0.99
+    assert 0.85 <= ratio <= 1.1
+
+
+def test_lone_strata():
+    # four strata of equal shares, two of them with a single sequence
+    n_draws = np.array([1, 1, 10, 10])
+    stratum = np.repeat(np.arange(4), n_draws)
+    weight = np.repeat(0.25 / (n_draws / n_draws.sum()), n_draws)
+    means = np.array([0.0, 1.0, 2.0, 3.0])
+    fitter = _fitter(stratum=stratum, weight=weight)
+    coverage, ratio = _coverage(
+        fitter, lambda rng: rng.normal(means[stratum], 1), truth=means.mean()
+    )
+    # the lone strata borrow the overall variance, which is conservative
+    assert coverage >= 0.9
+    assert 0.8 <= ratio <= 1.2
+
+
+def test_reproducible():
+    fitter = _fitter()
+    stats = _stats(np.random.RandomState(0).normal(size=40))
+    first = fitter._bootstrap(stats, n_boot=100, ci_level=0.9, seed=1)
+    second = fitter._bootstrap(stats, n_boot=100, ci_level=0.9, seed=1)
+    assert first.equals(second)
+    assert list(first.columns) == [
+        "bias_lower",
+        "bias_upper",
+        "stdev_lower",
+        "stdev_upper",
+    ]
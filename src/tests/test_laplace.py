@@ -0,0 +1,57 @@
+"""The Laplace approximation agrees with NUTS on the moments of the trend
+"""
+
+import numpy as np
+import pytest
+
+from codebase.statfit.laplace import fit_laplace, sample_laplace
+from codebase.statfit.nonstationary import PRIORS
+from codebase.synthetic import NINO3Linear
+
+PRIOR = {
+    "mu0_mean": 7,
+    "mu0_sd": 1.5,
+    "beta_mu_mean": 0,
+    "beta_mu_sd": 0.1,
+    "cv_logmean": np.log(0.1),
+    "cv_logsd": 0.1,
+}
+
+
+def _historical(n_seq=3, N=50, M=5) -> NINO3Linear:
+    generator = NINO3Linear(
+        M=M, N=N, n_seq=n_seq, mu0=7, gamma=0.01, beta=0.3, coeff_var=0.1, seed=11
+    )
+    generator.get_data()
+    return generator
+
+
+def test_mode_is_stationary_point():
+    generator = _historical()
+    y = generator.data.sel(year=generator._get_time("historical")).values
+    laplace = fit_laplace(y, prior=PRIOR)
+    assert set(PRIORS) == set(PRIOR)
+    assert np.all(np.isfinite(laplace["mode"]))
+    assert np.all(np.linalg.eigvalsh(laplace["cov"]) > 0)
+    draws = sample_laplace(laplace, n_sim=500, M=generator.M)
+    assert draws["mu"].shape == (y.shape[0], 500, generator.M)
+
+
+def test_matches_nuts():
+    pystan = pytest.importorskip("pystan", minversion="2.17")
+    assert hasattr(pystan, "StanModel")
+    from codebase.statfit import LN2LinearTrend
+
+    generator = _historical()
+    fitter = LN2LinearTrend(synthetic=generator, n_mcsim=2000, n_warmup=1000, **PRIOR)
+    y = generator.data.sel(year=generator._get_time("historical")).values
+    laplace = sample_laplace(
+        fit_laplace(y, prior=PRIOR),
+        n_sim=2000,
+        M=generator.M,
+        rng=np.random.RandomState(0),
+    )
+    for i, data in enumerate(y):
+        nuts = fitter._calculate_one_lognormal(data=data)[..., 0]  # mu
+        assert np.allclose(laplace["mu"][i].mean(axis=0), nuts.mean(axis=0), atol=0.05)
+        assert np.allclose(laplace["mu"][i].std(axis=0), nuts.std(axis=0), rtol=0.2)
@@ -0,0 +1,58 @@
+"""Seeded draws of a year don't change with the planning period M
+"""
+
+import numpy as np
+
+from codebase.crn import common_random_numbers
+from codebase.synthetic import MarkovTwoStateChain, NINO3Linear
+
+
+def _markov(M: int, N: int = 20) -> MarkovTwoStateChain:
+    return MarkovTwoStateChain(
+        M=M,
+        N=N,
+        n_seq=5,
+        pi_1=0.9,
+        pi_2=0.9,
+        mu_1=6.75,
+        mu_2=6,
+        gamma_1=0,
+        gamma_2=0,
+        coeff_var=0.1,
+        sigma_min=0.01,
+        seed=3,
+    )
+
+
+def test_markov_unchanged_by_M():
+    short, long = _markov(M=10).get_data(), _markov(M=20).get_data()
+    common = long.sel(year=short["year"])
+    assert np.array_equal(short.values, common.values)
+
+
+def test_markov_unchanged_by_N():
+    short, long = _markov(M=10, N=20).get_data(), _markov(M=10, N=30).get_data()
+    common = long.sel(year=short["year"])
+    assert np.array_equal(short.values, common.values)
+
+
+def test_noise_unchanged_by_M():
+    generator = {
+        M: NINO3Linear(M=M, N=20, n_seq=2, mu0=6, seed=3) for M in [10, 20]
+    }
+    for stream in ["normal", "uniform"]:
+        short = generator[10]._draw_years(None, seq=2, stream=stream)
+        long = generator[20]._draw_years(None, seq=2, stream=stream)
+        assert np.array_equal(short, long[: short.size])
+
+
+def test_shares_history():
+    assert _markov(M=10).shares_history()
+    assert not NINO3Linear(M=10, N=20, n_seq=2, mu0=6, seed=3).shares_history()
+    assert NINO3Linear(M=10, N=20, n_seq=2, mu0=6).shares_history()
+
+
+def test_common_random_numbers_extend():
+    short = common_random_numbers(1, "normal", [2, 3], n_sim=50, years=range(1, 11))
+    long = common_random_numbers(1, "normal", [3], n_sim=50, years=range(1, 21))
+    assert np.array_equal(short[1], long[0, :, :10])
@@ -0,0 +1,57 @@
+"""Compact storage of projections round-trips to the same exceedances
+"""
+
+import numpy as np
+import xarray as xr
+
+from codebase.plotting import get_flows
+from codebase.storage import encode, exceedance_fraction
+
+THRESHOLDS = [500, 1000, 3000]
+
+
+def _projection(n_seq=4, n_mcsim=200, M=10, seed=0) -> xr.DataArray:
+    """Log-normal flows, with one failed fit (all NaN)
+    """
+    rng = np.random.RandomState(seed)
+    flows = np.exp(rng.normal(7, 0.7, size=(n_seq, n_mcsim, M)))
+    flows[1] = np.nan
+    return xr.DataArray(
+        flows,
+        coords={
+            "sequence": 1 + np.arange(n_seq),
+            "simulation": 1 + np.arange(n_mcsim),
+            "year": 1 + np.arange(M),
+        },
+        dims=["sequence", "simulation", "year"],
+    )
+
+
+def test_int16_round_trip():
+    data = _projection()
+    encoded = encode(data, storage="int16")
+    assert encoded.dtype == np.int16
+    decoded = get_flows(encoded)
+    assert np.array_equal(np.isnan(decoded.values), np.isnan(data.values))
+    max_error = float(encoded["log_scale"]) / 2 + 1e-12
+    log_error = np.abs(np.log(decoded.values) - np.log(data.values))
+    assert np.nanmax(log_error) <= max_error
+
+
+def test_int16_exceedance():
+    data = _projection()
+    encoded = encode(data, storage="int16")
+    for threshold in THRESHOLDS:
+        expected = exceedance_fraction(data, threshold=threshold)
+        actual = exceedance_fraction(encoded, threshold=threshold)
+        # only flows within one quantization step of the threshold can differ
+        assert np.allclose(actual.values, expected.values, atol=0.02)
+
+
+def test_exceedance_round_trip():
+    data = _projection(n_mcsim=203)  # not a multiple of 8
+    encoded = encode(data, storage="exceedance", thresholds=THRESHOLDS)
+    for threshold in THRESHOLDS:
+        expected = exceedance_fraction(data, threshold=threshold)
+        actual = exceedance_fraction(encoded, threshold=threshold)
+        assert np.array_equal(actual.values, expected.values)
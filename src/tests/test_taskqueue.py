@@ -0,0 +1,90 @@
+"""Tasks move between the states of the queue as workers claim, fail and
+complete them
+"""
+
+import time
+import pytest
+
+from codebase.taskqueue import DONE, FAILED, PENDING, RUNNING, TaskQueue
+
+
+def _tasks():
+    generate = dict(name="generate:a", kind="generate", cell=0, start=None)
+    fits = [
+        dict(name="fit:0:{}".format(start), kind="fit", cell=0, start=start)
+        for start in [1, 11]
+    ]
+    merge = dict(name="merge:0", kind="merge", cell=0, start=None)
+    tasks = [generate] + fits + [merge]
+    for task in tasks:
+        task.setdefault("stop", None)
+        task["after"] = "generate:a" if task["kind"] == "fit" else None
+    return tasks
+
+
+@pytest.fixture
+def queue_file(tmp_path):
+    filename = str(tmp_path / "queue.sqlite")
+    TaskQueue(filename).add(_tasks())
+    return filename
+
+
+def _worker(queue_file, name, **kwargs) -> TaskQueue:
+    queue = TaskQueue(queue_file, **kwargs)
+    queue.worker = name
+    return queue
+
+
+def test_order(queue_file):
+    queue = _worker(queue_file, "a")
+    generate = queue.claim()
+    assert generate.kind == "generate"
+    assert queue.claim() is None  # the fits wait for the generator
+    queue.complete(generate)
+    fits = [queue.claim(), queue.claim()]
+    assert [fit.kind for fit in fits] == ["fit", "fit"]
+    assert queue.claim() is None  # the merge waits for every fit
+    for fit in fits:
+        queue.complete(fit)
+    assert queue.claim().kind == "merge"
+    assert queue.counts() == {DONE: 3, RUNNING: 1}
+
+
+def test_add_is_idempotent(queue_file):
+    queue = _worker(queue_file, "a")
+    queue.add(_tasks())
+    assert queue.counts() == {PENDING: 4}
+
+
+def test_fail_requeues_until_max_attempts(queue_file):
+    queue = _worker(queue_file, "a", max_attempts=2)
+    task = queue.claim()
+    queue.fail(task)
+    assert queue.counts() == {PENDING: 4}
+    task = queue.claim()
+    queue.fail(task)
+    assert queue.counts() == {FAILED: 1, PENDING: 3}
+    assert queue.claim() is None  # nothing else can run
+
+
+def test_dead_worker_requeued_then_failed(queue_file):
+    dead = _worker(queue_file, "dead", heartbeat_timeout=0, max_attempts=2)
+    alive = _worker(queue_file, "alive", heartbeat_timeout=0, max_attempts=2)
+    task = dead.claim()
+    time.sleep(0.01)
+    assert alive.claim().name == task.name  # taken back and claimed again
+    time.sleep(0.01)
+    assert alive.claim() is None  # tried twice: failed
+    assert alive.counts() == {FAILED: 1, PENDING: 3}
+
+
+def test_stale_complete_is_ignored(queue_file):
+    stale = _worker(queue_file, "stale", heartbeat_timeout=0)
+    owner = _worker(queue_file, "owner", heartbeat_timeout=0)
+    task = stale.claim()
+    time.sleep(0.01)
+    owner.claim()
+    stale.complete(task)
+    assert owner.counts() == {RUNNING: 1, PENDING: 3}
+    owner.complete(task)
+    assert owner.counts() == {DONE: 1, PENDING: 3}